@@ -1,6 +1,22 @@
 """ FakeAPI package """
 
-from .api import FakeAPI, FakeResponse
-from .fakeserver import FakeAPIServer, FakeAPIHTTPHandler
+from time import perf_counter
+IMPORT_START = perf_counter()    # python -m fakeapi --timing import phase
+# pylint: disable=C0413
+from .api import FakeAPI, AsyncFakeAPI, FakeResponse
+from .fakeserver import FakeAPIServer, FakeAPIThreadingServer, FakeAPIHTTPHandler
 from .urlfunc import get_url, get_url2
 from .urlconfighelper import UrlConfigHelper
+from .lazyconfig import LazyUrlConfig, write_jsonl
+from .recorder import RecordingProxy
+
+def __getattr__(name):
+    """ asyncio server and requests adapter are imported when used (slow imports) """
+    # pylint: disable=C0415
+    if name == 'FakeAPIAsyncServer':
+        from .asyncserver import FakeAPIAsyncServer
+        return FakeAPIAsyncServer
+    if name == 'FakeAPIAdapter':
+        from .adapter import FakeAPIAdapter
+        return FakeAPIAdapter
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
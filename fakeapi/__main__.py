@@ -1,7 +1,13 @@
 #!/usr/bin/env python
 """ start fakeapi http server """
+import sys
+import time
 import argparse
-from fakeapi import FakeAPI
+from fakeapi import FakeAPI, IMPORT_START
+from fakeapi.fakelog import setup_logging, stop_logging
+from fakeapi.watcher import ConfigWatcher
+from fakeapi.recorder import RecordingProxy
+IMPORTED = time.perf_counter()
 
 def fakeapi_server():
     """ start http server according to args """
@@ -12,12 +18,96 @@ def fakeapi_server():
                         help="HTTP server port")
     parser.add_argument("-P", "--prefix", type=str, default=None,
                         help="HTTP prefix (http://server:port)")
+    parser.add_argument("-e", "--engine", type=str, default='threading',
+                        choices=['http', 'threading', 'asyncio'],
+                        help="HTTP server engine")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="HTTP server processes")
+    parser.add_argument("-H", "--history", type=str, default='counters',
+                        choices=['full', 'ring', 'counters', 'off'],
+                        help="calls history recording")
+    parser.add_argument("--history-size", type=int, default=1000,
+                        help="calls kept in ring history")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="log only warnings and errors")
+    parser.add_argument("-a", "--access-log", type=str, default=None,
+                        help="json lines access log file ('-' for stderr)")
+    parser.add_argument("-z", "--compress", type=str, default='on',
+                        choices=['off', 'on', 'precompress'],
+                        help="gzip/deflate/br responses (precompress at startup)")
+    parser.add_argument("--delay-ms", type=float, default=0,
+                        help="default response delay (ms)")
+    parser.add_argument("--jitter-ms", type=float, default=0,
+                        help="default response delay jitter (ms)")
+    parser.add_argument("--jitter", type=str, default='uniform',
+                        choices=['uniform', 'normal', 'exponential'],
+                        help="jitter distribution")
+    parser.add_argument("--bytes-per-s", type=int, default=None,
+                        help="default response body throttling (bytes/s)")
+    parser.add_argument("--watch", action="store_true",
+                        help="reload json file when modified")
+    parser.add_argument("--admin", action="store_true",
+                        help="enable /_fakeapi/routes endpoint to patch routes")
+    parser.add_argument("--metrics", action="store_true",
+                        help="enable /_fakeapi/metrics endpoint")
+    parser.add_argument("--cache", action="store_true",
+                        help="load jsonfile from its compiled cache (jsonfile.fakeapi-cache)")
+    parser.add_argument("--timing", action="store_true",
+                        help="print startup phases durations on stderr")
+    parser.add_argument("--record", type=str, default=None, metavar="UPSTREAM",
+                        help="proxy to UPSTREAM api url, record calls to jsonfile (json lines)")
     parser.add_argument("jsonfile", type=str, default='-', nargs='?',
                         help="Json file for FakeAPI")
     args = parser.parse_args()
-    api = FakeAPI(url_json=args.jsonfile)
-    api.http_server(args.server, args.port, args.prefix)
+    if args.record:
+        if args.jsonfile == '-':
+            parser.error('--record needs a jsonfile to record calls to')
+        if args.workers > 1:
+            parser.error('--record appends to jsonfile from one process, use --workers 1')
+    setup_logging(args.quiet, args.access_log)
+    try:
+        if args.record:
+            record_calls(args)
+            return
+        api = FakeAPI(url_json=args.jsonfile, history=args.history,
+                      history_size=args.history_size,
+                      latency={'delay_ms': args.delay_ms, 'jitter_ms': args.jitter_ms,
+                               'jitter': args.jitter, 'bytes_per_s': args.bytes_per_s},
+                      compiled_cache=args.cache)
+        timings = {'import': IMPORTED - IMPORT_START, 'load': api.timings['load'],
+                   'index': api.timings['index']}
+        start = time.perf_counter()
+        if args.compress == 'precompress':
+            api.precompress()
+            timings['precompress'] = time.perf_counter() - start
+        if args.watch and args.jsonfile != '-':
+            ConfigWatcher(api, args.jsonfile).start()
+        start = time.perf_counter()
+        http_server = api.http_server(args.server, args.port, args.prefix, start=False,
+                                      engine=args.engine, compress=args.compress != 'off',
+                                      admin=args.admin, metrics=args.metrics)
+        timings['server'] = time.perf_counter() - start
+        if args.timing:
+            print_timings(timings, api.timings['cache'])
+        http_server.start(args.workers)
+    finally:
+        stop_logging()
 
+def print_timings(timings, cache):
+    """ startup phases durations (ms) on stderr """
+    phases = ', '.join(f'{phase} {duration * 1000:.1f}' for phase, duration in timings.items())
+    print(f'startup ms: {phases}, total {(time.perf_counter() - IMPORT_START) * 1000:.1f} '
+          f'(cache {cache})', file=sys.stderr, flush=True)
+
+def record_calls(args):
+    """ recording proxy server """
+    recorder = RecordingProxy(args.record, args.jsonfile, args.prefix)
+    try:
+        FakeAPI().http_server(args.server, args.port, engine=args.engine,
+                              compress=args.compress != 'off', metrics=args.metrics,
+                              recorder=recorder)
+    finally:
+        recorder.close()
 
 if __name__ == '__main__':
     fakeapi_server()
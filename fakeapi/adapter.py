@@ -0,0 +1,94 @@
+"""
+requests transport adapter serving FakeAPI responses
+session.mount('http://localhost', FakeAPIAdapter(api)) or api.mock_requests(test_case)
+for all sessions (requests.get/requests.request/Session), without mocks call recording
+"""
+
+import io
+import json
+import time
+from http import HTTPStatus
+from urllib.parse import parse_qsl
+from unittest.mock import patch
+import requests
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+class FakeAPIAdapter(BaseAdapter):
+    """
+    requests adapter answering from FakeAPI routes with requests.Response
+    json body is passed as payload, form body as dict (as data= of FakeAPI.post)
+    record: keep sent PreparedRequest in calls
+    """
+
+    def __init__(self, fakeapi, record=False):
+        super().__init__()
+        self.fakeapi = fakeapi
+        self.record = record
+        self.calls = []
+
+    @staticmethod
+    def payload(request):
+        """ payload decoded from request body """
+        body = request.body
+        if not body:
+            return None
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        content_type = request.headers.get('Content-Type', '')
+        if 'json' in content_type:
+            return json.loads(body)
+        if 'x-www-form-urlencoded' in content_type:
+            return dict(parse_qsl(body, keep_blank_values=True))
+        return body
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        """ requests.Response of FakeAPI route """
+        if self.record:
+            self.calls.append(request)
+        api = self.fakeapi
+        method = request.method.lower()
+        fake, _ = api.fake_response(method, request.url, self.payload(request),
+                                    headers=request.headers)
+        if api.sleep and (fake.delay or fake.bytes_per_s):
+            time.sleep(api.wait_time(fake))
+        content = fake.content or b''
+        response = Response()
+        response.status_code = fake.status_code
+        try:
+            response.reason = HTTPStatus(fake.status_code).phrase
+        except ValueError:
+            response.reason = None
+        response.headers = CaseInsensitiveDict(fake.headers)
+        response.headers.setdefault('Content-Type', 'application/json')
+        response.headers['Content-Length'] = str(len(content))
+        response.encoding = 'utf-8'
+        response.raw = io.BytesIO(b'' if method == 'head' else content)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        """ nothing to release """
+
+    def patch_sessions(self, test_case=None, prefixes=('http://', 'https://')):
+        """
+        serve urls starting with prefixes for all requests sessions
+        patch is stopped at test_case cleanup, else returns patcher to stop
+        """
+        get_adapter = requests.Session.get_adapter
+        adapter = self
+
+        def fake_get_adapter(session, url):
+            """ adapter for url """
+            if url.lower().startswith(prefixes):
+                return adapter
+            return get_adapter(session, url)
+
+        patcher = patch.object(requests.Session, 'get_adapter', fake_get_adapter)
+        patcher.start()
+        if test_case is not None:
+            test_case.addCleanup(patcher.stop)
+        return patcher
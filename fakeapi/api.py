@@ -24,80 +24,519 @@ api = FakeAPI(url_config = {
 
 url_config data can be loaded by json file specified in url_json.
 """
-# pylint: disable=W0613,C0103,R0902,R0903,R1732
+# pylint: disable=W0613,C0103,R0902,R0903,R1732,W0212
 
 __author__ = "Franck Jouvanceau"
 
+import os
 import json
 import sys
+import logging
+import time
+import threading
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
 from copy import copy
-from unittest.mock import MagicMock, patch
+from collections import deque
 from . import urlfunc
 from . import fakeserver
+from . import compiled
+from .routes import (Route, LRUCache, RouteTrie, UrlConfig, Latency, BodyStore, COMPRESSORS,
+                     SLICE_PARAMS, json_chunks, slice_items)
+from .memory import memory_report
+from .lazyconfig import LazyUrlConfig
+from .resources import Resource, RESOURCE
+from .matchers import BodyMatchers, RequestBody, BODY
+from .metrics import Metrics, MISS
+from .fakelog import logger
+
+_UNSET = object()
+HISTORY_MODES = ('full', 'ring', 'counters', 'off')
 
 class FakeResponse():
     """ Fake Response """
-    status_code = 200
-    ok          = True
-    url         = None
-    method      = None
-    payload     = None
-    params      = None
-    content     = None
-    reason      = None
-    text        = None
+    __slots__ = ('status_code', 'ok', 'url', 'method', 'payload', 'params', 'reason', 'file',
+                 'headers', 'path_params', 'route', 'resource', 'delay', 'bytes_per_s', 'chunks',
+                 '_content', '_text', '_json')
+
+    def __init__(self):
+        self.status_code = 200
+        self.ok          = True
+        self.url         = None
+        self.method      = None
+        self.payload     = None
+        self.params      = None
+        self.reason      = None
+        self.file        = None
+        self.headers     = {}
+        self.path_params = None
+        self.route       = None
+        self.resource    = None
+        self.delay       = 0
+        self.bytes_per_s = None
+        self.chunks      = None
+        self._content    = None
+        self._text       = None
+        self._json       = _UNSET
+
+    @property
+    def content(self):
+        """ bytes content, read from file/chunks on first access for file/stream routes """
+        if self._content is None and self.file:
+            with open(self.file, 'rb') as body:
+                self._content = body.read()
+        elif self._content is None and self.chunks is not None:
+            self._content = b''.join(self.chunks())
+        return self._content
+
+    @content.setter
+    def content(self, content):
+        self._content = content
+
+    @property
+    def text(self):
+        """ text content """
+        if self._text is None and (self.file or self.chunks is not None):
+            self._text = self.content.decode('utf-8')
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
 
     def json(self):
         """ return data """
+        if self._json is not _UNSET:
+            return self._json
         return json.loads(self.content)
 
+def get_header(headers, name):
+    """ header value from dict (case insensitive) or http.client headers """
+    value = headers.get(name)
+    if value is None and isinstance(headers, dict):
+        name = name.lower()
+        value = next((val for key, val in headers.items() if key.lower() == name), None)
+    return value
+
+def not_modified(headers, etag, last_modified):
+    """ conditional GET headers match etag or last_modified """
+    if_none_match = get_header(headers, 'If-None-Match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag.removeprefix('W/') in [tag.removeprefix('W/') for tag in tags]
+    if_modified_since = get_header(headers, 'If-Modified-Since')
+    if if_modified_since is None:
+        return False
+    try:
+        return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
 class FakeAPI():
     """ Fake API from static json files """
 
-    def __init__(self, url_config=None, url_json=None, nourl_status=404, returns='response'):
+    def __init__(self, url_config=None, url_json=None, nourl_status=404, returns='response',
+                 history='full', history_size=1000, latency=None, sleep=False,
+                 compiled_cache=False):
         """
             url_config optional dict to map urls to json files
             url_json path to json file containing url_config dict
             returns may be 'response' or 'json'
+            history may be:
+              'full': record all calls in url_history/url_history_full/responses
+              'ring': keep only last history_size calls (deques)
+              'counters': only url_calls counts and last status_code
+              url_calls are per url_config key in ring/counters modes
+              'off': no history
+            latency default dict of delay_ms/jitter_ms/jitter/bytes_per_s (see Latency)
+              for routes without latency keys
+            sleep: in-process calls wait for response delay (http server always does)
+            compiled_cache: load url_json from its compiled cache (written if missing/stale)
         """
+        if history not in HISTORY_MODES:
+            raise ValueError(f'history must be one of {HISTORY_MODES}')
         self.returns = returns
         self.nourl_status = nourl_status
-        self.set_config(url_config, url_json)
+        self.history = history
+        self.history_size = history_size
+        self.latency = Latency(**(latency or {}))
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self.bodies = BodyStore()
+        self.set_config(url_config, url_json, compiled_cache)
         self.reset_history()
 
-    def set_config(self, url_config=None, url_json=None):
-        """ Set url_config """
-        self.url_config = url_config or {}
-        if url_json:
+    def set_config(self, url_config=None, url_json=None, compiled_cache=False):
+        """
+        Set url_config
+        url_json '*.jsonl' json lines file is loaded lazily (LazyUrlConfig)
+        route 'file' paths are relative to url_json directory (else current directory)
+        compiled_cache: use url_json compiled cache (see compiled module)
+        timings: load/index durations (s), 'cache' hit/miss/off
+        """
+        self.base_dir = None
+        if url_json and url_json != '-':
+            self.base_dir = os.path.dirname(os.path.abspath(url_json))
+        start = time.perf_counter()
+        cached = None
+        compiled_cache = compiled_cache and url_json and url_json != '-' \
+            and not url_json.endswith('.jsonl')
+        if compiled_cache:
+            cached = compiled.load(url_json)
+        if cached is not None:
+            url_config, url_index = cached
+        elif url_json and url_json.endswith('.jsonl'):
+            url_config = LazyUrlConfig(url_json)
+        elif url_json:
             jsf = sys.stdin if url_json == '-' else open(url_json, 'r', encoding='utf-8')
-            self.url_config = json.load(jsf)
+            url_config = json.load(jsf)
             jsf.close()
+        loaded = time.perf_counter()
+        if cached is not None:
+            self.reindex(url_config, url_index)
+        else:
+            self.url_config = url_config or {}
+        self.timings = {'load': loaded - start, 'index': time.perf_counter() - loaded,
+                        'cache': 'off' if not compiled_cache else 'hit' if cached else 'miss'}
+        if compiled_cache and cached is None:
+            compiled.save(url_json, self.url_config, self.url_index)
+
+    @property
+    def url_config(self):
+        """ url_config dict: {'METHOD url': {'status_code': ..., 'data': ...}} """
+        return self._index[0]
+
+    @url_config.setter
+    def url_config(self, url_config):
+        """ set url_config and index its routes """
+        self.reindex(url_config)
+
+    @property
+    def url_index(self):
+        """ url_config keys by canonical url_key """
+        return self._index[1]
+
+    @property
+    def url_trie(self):
+        """ url templates RouteTrie """
+        return self._index[2]
+
+    @property
+    def routes(self):
+        """ Route (cached responses) by url_config key """
+        return self._index[3]
+
+    @property
+    def resources(self):
+        """ RESOURCE collections by canonical url """
+        return self._index[5]
+
+    @property
+    def body_index(self):
+        """ BodyMatchers of routes with body matcher by canonical url_key """
+        return self._index[6]
+
+    @staticmethod
+    def index_key(url_trie, url_index, url_method, body_index=None, body=None):
+        """
+        add url_config key to url_index, or url_trie for url templates,
+        or body_index for routes with body matcher
+        """
+        method, _, url = url_method.partition(' ')
+        if method == RESOURCE:
+            return
+        for key in urlfunc.config_keys(method, url):
+            # methods and query params names are repeated in many keys
+            key = (sys.intern(key[0]), key[1], tuple((sys.intern(name), value)
+                                                     for name, value in key[2]))
+            if body is not None:
+                body_index.setdefault(key, BodyMatchers()).add(body, url_method)
+                continue
+            if '{' in key[1] or '*' in key[1]:
+                origin, segments = urlfunc.split_url(key[1])
+                if RouteTrie.is_template(segments):
+                    url_trie.insert(key[0], origin, segments, key[2], url_method)
+                    continue
+            url_index.setdefault(key, url_method)
+
+    def reindex(self, url_config=None, url_index=None):
+        """
+        build index of url_config keys by canonical url_key
+        and trie of url templates keys (see RouteTrie)
+        done automatically when url_config is set or modified (UrlConfig version)
+        drops cached responses (to be called if data is modified in place)
+        cached responses are bounded to url_config cache_size if defined (LazyUrlConfig)
+        index is replaced in one assignment, lookups in progress use previous index
+        url_config dict is copied in a UrlConfig (api.url_config is to be modified)
+        url_index: precomputed url_index of url_config (compiled cache),
+          only url templates and routes with body matcher are indexed
+        body matchers are not indexed for LazyUrlConfig (not to load all routes)
+        """
+        resources = {}
+        if url_config is None:
+            url_config, resources = self._index[0], self._index[5]
+        if not hasattr(url_config, 'version'):
+            url_config = UrlConfig(url_config)
+        url_trie = RouteTrie()
+        body_index = {}
+        lazy = isinstance(url_config, LazyUrlConfig)
+        if url_index is None:
+            url_index = {}
+            url_methods = url_config
+        else:
+            url_methods = [url_method for url_method in url_config
+                           if '{' in url_method or '*' in url_method
+                           or BODY in url_config[url_method]]
+        for url_method in url_methods:
+            self.index_key(url_trie, url_index, url_method, body_index,
+                           None if lazy else url_config[url_method].get(BODY))
+        cache_size = getattr(url_config, 'cache_size', None)
+        routes = {} if cache_size is None else LRUCache(cache_size)
+        self._index = (url_config, url_index, url_trie, routes, url_config.version,
+                       self.index_resources(url_config, resources), body_index)
+
+    @staticmethod
+    def index_resources(url_config, resources):
+        """
+        Resource by canonical url of url_config RESOURCE keys
+        resources with unchanged conf are kept with their items
+        """
+        indexed = {}
+        for url_method in url_config:
+            method, _, url = url_method.partition(' ')
+            if method != RESOURCE:
+                continue
+            url = urlfunc.url_key(method, url)[1]
+            url_conf = url_config[url_method]
+            resource = resources.get(url)
+            if resource is None or resource.conf != url_conf:
+                resource = Resource(url_conf, url_method)
+            indexed[url] = resource
+        return indexed
+
+    def update_config(self, url_config):
+        """
+        replace url_config with new url_config, only added/removed/changed routes are indexed
+        unchanged routes keep their cached responses, index is replaced in one assignment
+        returns {'added': [...], 'removed': [...], 'changed': [...]} url_config keys
+        """
+        with self._update_lock:
+            old_config, url_index, url_trie, routes, _, resources, body_index = self._index
+            diff = {'added': [], 'removed': [], 'changed': []}
+            if isinstance(old_config, LazyUrlConfig) or isinstance(url_config, LazyUrlConfig):
+                # routes are not loaded to be compared, only added/removed keys are reported
+                diff['added'] = [url_method for url_method in url_config
+                                 if url_method not in old_config]
+                diff['removed'] = [url_method for url_method in old_config
+                                   if url_method not in url_config]
+                self.reindex(url_config)
+                return diff
+            new_config = UrlConfig()
+            for url_method, url_conf in url_config.items():
+                old_conf = old_config.get(url_method)
+                if old_conf is None:
+                    diff['added'].append(url_method)
+                elif old_conf != url_conf:
+                    diff['changed'].append(url_method)
+                else:
+                    url_conf = old_conf
+                new_config[url_method] = url_conf
+            diff['removed'] = [url_method for url_method in old_config
+                               if url_method not in new_config]
+            url_index = dict(url_index)
+            # changed routes are reindexed as their body matcher may have changed
+            for url_method in diff['removed'] + diff['changed']:
+                method, _, url = url_method.partition(' ')
+                for key in urlfunc.config_keys(method, url):
+                    if url_index.get(key) == url_method:
+                        del url_index[key]
+            if any('{' in url_method or '*' in url_method
+                   for url_method in diff['added'] + diff['removed']):
+                url_trie = RouteTrie()
+                for url_method in new_config:
+                    if '{' in url_method or '*' in url_method:
+                        self.index_key(url_trie, {}, url_method)
+            if any(BODY in old_config.get(url_method, {}) or BODY in new_config.get(url_method, {})
+                   for url_method in diff['added'] + diff['removed'] + diff['changed']):
+                body_index = {}
+                for url_method, url_conf in new_config.items():
+                    if BODY in url_conf:
+                        self.index_key(None, None, url_method, body_index, url_conf[BODY])
+            for url_method in diff['added'] + diff['changed']:
+                self.index_key(RouteTrie(), url_index, url_method, {},
+                               new_config[url_method].get(BODY))
+            routes = {url_method: route for url_method, route in list(routes.items())
+                      if url_method in new_config and url_method not in diff['changed']}
+            self._index = (new_config, url_index, url_trie, routes, new_config.version,
+                           self.index_resources(new_config, resources), body_index)
+            return diff
+
+    def lookup(self, keys, data=None, verbatim=None):
+        """
+        (Route, captures) for first canonical url_key of keys found in url_config
+        routes with body matcher matching data first, then verbatim url_config key
+        (called 'METHOD url'), then exact urls, then url templates
+        (captures are template {name} values)
+        """
+        url_config, url_index, url_trie, routes, version, _, body_index = self._index
+        if version != url_config.version:
+            self.reindex()
+            return self.lookup(keys, data, verbatim)
+        captures = None
+        url_method = None
+        if body_index and data is not None:
+            body = None    # canonicalized once for all keys
+            for key in keys:
+                matchers = body_index.get(key)
+                if matchers is None:
+                    continue
+                body = body or RequestBody(data)
+                url_method = matchers.match(body)
+                if url_method is not None:
+                    break
+        if url_method is None and verbatim is not None and verbatim in url_config \
+                and BODY not in url_config[verbatim]:
+            url_method = verbatim
+        if url_method is None:
+            for key in keys:
+                url_method = url_index.get(key)
+                if url_method is not None:
+                    break
+        if url_method is None:
+            if not url_trie.size:
+                return None, None
+            for key in keys:
+                url_method, captures = url_trie.match(key[0], *urlfunc.split_url(key[1]), key[2])
+                if url_method is not None:
+                    break
+            else:
+                return None, None
+        url_conf = url_config.get(url_method)
+        if url_conf is None:    # removed since indexed
+            self.reindex()
+            return self.lookup(keys, data, verbatim)
+        route = routes.get(url_method)
+        if route is None or not route.is_current(url_conf):
+            route = routes[url_method] = Route(url_method, url_conf, self.base_dir, self.bodies)
+        return route, captures
+
+    def precompress(self, encodings=None, min_size=1024):
+        """
+        compress routes content for encodings (default all available)
+        to be called before starting http server (and forking workers)
+        """
+        for url_method in list(self.url_config):
+            method, _, url = url_method.partition(' ')
+            route = self.lookup((urlfunc.url_key(method, url),))[0]
+            if route is None or route.file or route.template or len(route.content) < min_size:
+                continue
+            for encoding in encodings or COMPRESSORS:
+                route.encoded(encoding)
+
+    def compact(self):
+        """
+        share identical data of url_config routes (same serialized json) between routes,
+        cached responses are shared by routes with identical data (see BodyStore)
+        returns number of routes data replaced by shared data
+        """
+        if isinstance(self.url_config, LazyUrlConfig):
+            return 0
+        shared = {}
+        replaced = 0
+        for url_conf in self.url_config.values():
+            data = url_conf.get('data')
+            if isinstance(data, (dict, list)):
+                first = shared.setdefault(json.dumps(data), data)
+                if first is not data:
+                    url_conf['data'] = first
+                    replaced += 1
+        self.reindex()
+        return replaced
+
+    def memory_report(self):
+        """
+        bytes used by url_config, indexes, shared bodies, cached routes and history
+        with total_bytes and bytes_per_route
+        """
+        return memory_report(self)
 
     def reset_history(self):
         """ Reset all calls history"""
-        self.url_history = []
-        self.url_history_full = []
-        self.url_calls = {}
-        self.responses = []
+        new = (lambda: deque(maxlen=self.history_size)) if self.history == 'ring' else list
+        with self.lock:
+            self.url_history = new()
+            self.url_history_full = new()
+            self.url_calls = {}
+            self.responses = new()
 
     def get_conf(self, method, url, params, data):
         """ retrieve conf for url in url_config """
-        method = method.upper()
-        url_key1 = urlfunc.get_url(url, params)
-        url_key2 = urlfunc.get_url2(url, params)
-        url_key3 = urlfunc.get_url(url_key1, data)
-        url_key4 = urlfunc.get_url2(url_key2, data)
-        self.url_history_full.append(f'{method} {url_key3}')
-        print(f'fakeapi: Calling: {method} {url_key3}', file=sys.stderr)
-        for url_k in list({url_key3, url_key4, url_key1, url_key2}):
-            url_k = f'{method} {url_k}'
-            if url_k in self.url_config:
-                return self.url_config[url_k]
-        print('fakeapi: No URL config found')
-        return None
-
-    def fake_call(self, method, url, data=None, params=None):
-        """ load json file corresponding to url/method """
+        route = self.get_route(method.upper(), url, params, data, urlfunc.get_url(url, params))[0]
+        if route is None:
+            logger.info('No URL config found')
+        return route.conf if route else None
+
+    def get_route(self, method, url, params, data, url_full):
+        """
+        retrieve (Route, captures) for url (url_full = get_url(url, params)) in url_config
+        routes with body matcher matching data, then data params
+        take precedence over url without data
+        """
+        key = urlfunc.url_key(method, url, params)
+        data_key = urlfunc.url_key_data(key, data)
+        history = self.history in ('full', 'ring')
+        if history or logger.isEnabledFor(logging.INFO):
+            if data_key is not key:
+                url_full = urlfunc.get_url(url_full, data)
+            if history:
+                with self.lock:
+                    self.url_history_full.append(f'{method} {url_full}')
+            logger.info('Calling: %s %s', method, url_full)
+        if data_key is not key:
+            route, captures = self.lookup((data_key, key), data)
+        else:
+            # called url as written in url_config is preferred to its canonical form
+            route, captures = self.lookup((key,), data, f'{method} {url_full}')
+        if route is None and any(name in SLICE_PARAMS for name, _ in key[2]):
+            route, captures = self.lookup(((key[0], key[1], tuple(
+                param for param in key[2] if param[0] not in SLICE_PARAMS)),))
+            if route is not None and not route.stream:
+                route, captures = None, None
+        return route, captures
+
+    def fake_call(self, method, url, data=None, params=None, headers=None):
+        """
+        load json file corresponding to url/method
+        response has ETag/Last-Modified headers, GET with headers If-None-Match/If-Modified-Since
+        matching them gets 304 response without content
+        """
+        response, return_data = self.fake_response(method, url, data, params, headers)
+        if self.sleep and (response.delay or response.bytes_per_s):
+            time.sleep(self.wait_time(response))
+        if self.returns == 'json':
+            return response.json() if response.file else return_data
+        return response
+
+    async def async_call(self, method, url, data=None, params=None, headers=None):
+        """ fake_call for asyncio code, response delay is waited with asyncio.sleep """
+        import asyncio    # pylint: disable=C0415
+        response, return_data = self.fake_response(method, url, data, params, headers)
+        if self.sleep and (response.delay or response.bytes_per_s):
+            await asyncio.sleep(self.wait_time(response))
+        if self.returns == 'json':
+            return response.json() if response.file else return_data
+        return response
+
+    @staticmethod
+    def wait_time(response):
+        """ simulated latency of response: delay and body transfer time """
+        if not response.bytes_per_s:
+            return response.delay
+        return response.delay + len(response.content or b'') / response.bytes_per_s
+
+    def fake_response(self, method, url, data=None, params=None, headers=None):
+        """ (FakeResponse, returned data) of call, recorded in history """
         response = FakeResponse()
         response.method = method
         response.params = params
@@ -106,30 +545,128 @@ class FakeAPI():
         response.url = urlfunc.get_url(url, params)
         url_method = f'{method.upper()} {response.url}'
         return_data = ''
-        url_conf = self.get_conf(method, url, params, data)
-        if url_conf:
-            if 'status_code' in url_conf:
-                response.status_code = url_conf['status_code']
-            return_data = url_conf['data']
+        route, response.path_params = self.get_route(method.upper(), url, params, data,
+                                                     response.url)
+        response.route = route
+        if route and route.conf:
+            if 'status_code' in route.conf:
+                response.status_code = route.conf['status_code']
+            return_data = route.data
+            if route.content_type:
+                response.headers['Content-Type'] = route.content_type
+            etag, last_modified = route.validators()
+            if etag:
+                response.headers['ETag'] = etag
+                response.headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+            if (etag and headers and method in ('get', 'head') and response.status_code == 200
+                    and not_modified(headers, etag, last_modified)):
+                response.status_code = 304
+                response.text = ''
+                response.content = b''
+            elif route.file:
+                response.file = route.file
+            elif route.stream:
+                return_data = self.stream_response(response, route,
+                                                   urlfunc.url_key(method, url, params)[2])
+            elif route.template:
+                response.text = route.template.render({
+                    'path': response.path_params or {},
+                    'query': dict(urlfunc.url_key(method, url, params)[2]),
+                    'payload': data,
+                    'now': datetime.now(timezone.utc).isoformat(),
+                    'timestamp': int(time.time()),
+                })
+                response.content = response.text.encode('utf-8')
+                if route.template.is_json:
+                    return_data = response.json()
+                else:
+                    return_data = response.text
+            else:
+                response.text = route.text
+                response.content = route.content
+        elif self.resources and self.resource_call(response, method, url, params, data):
+            return_data = response._json
         else:
+            logger.info('No URL config found')
             response.status_code = self.nourl_status
-        response.text = return_data if isinstance(return_data, str) else json.dumps(return_data)
-        response.content = response.text.encode('utf-8')
+            response.text = ''
+            response.content = b''
         response.ok = response.status_code < 400
-        self.responses.append(copy(response))
-        self.url_history.append(url_method)
-        self.url_calls[url_method] = {
-            'data': return_data,
-            'status_code': response.status_code,
-            'payload': data
-        }
-        if self.returns == 'json':
-            return return_data
-        return response
+        latency = route and route.latency or self.latency
+        if latency:
+            response.delay = latency.delay()
+            response.bytes_per_s = latency.bytes_per_s
+        self.record_call(url_method, response, return_data, data)
+        return response, return_data
+
+    @staticmethod
+    def stream_response(response, route, query):
+        """
+        set response chunks of stream route, list data sliced by offset/limit/cursor query
+        returns sliced data
+        """
+        data = route.data
+        if isinstance(data, list):
+            try:
+                data, headers = slice_items(data, query)
+            except ValueError as error:
+                response.status_code = 400
+                data, headers = {'error': str(error)}, {}
+            response.headers.update(headers)
+        response._json = data
+        response.chunks = lambda: json_chunks(data)
+        return data
+
+    def resource_call(self, response, method, url, params, data):
+        """
+        set response of RESOURCE collection or item matching url, False if none
+        """
+        key = urlfunc.url_key(method, url, params)
+        resources = self.resources
+        item_id = None
+        resource = resources.get(key[1])
+        if resource is None:
+            collection, _, item_id = key[1].rpartition('/')
+            resource = resources.get(collection)
+            if resource is None or not item_id:
+                return False
+        status_code, return_data, headers = resource.call(method, item_id, key[2], data)
+        response.resource = resource
+        response.status_code = status_code
+        response.headers.update(headers)
+        response._json = return_data
+        response.text = json.dumps(return_data)
+        response.content = response.text.encode('utf-8')
+        return True
+
+    def record_call(self, url_method, response, return_data, payload):
+        """
+        record call in history according to history mode
+        url_calls keeps last call data/status_code/payload and count of calls per url,
+        per url_config key in ring/counters modes (urls not in url_config share MISS key)
+        """
+        if self.history == 'off':
+            return
+        calls_key = url_method
+        if self.history != 'full':
+            route = response.route or response.resource
+            calls_key = route.url_method if route else MISS
+        with self.lock:
+            calls = self.url_calls.get(calls_key)
+            if calls is None:
+                calls = self.url_calls[calls_key] = {'count': 0}
+            calls['count'] += 1
+            calls['status_code'] = response.status_code
+            if self.history == 'counters':
+                return
+            calls['data'] = return_data
+            calls['payload'] = payload
+            self.responses.append(copy(response))
+            self.url_history.append(url_method)
 
     def get(self, url, params=None, **kwargs):
         """ http get simulation """
-        return self.fake_call('get', url, params=params)
+        return self.fake_call('get', url, params=params, headers=kwargs.get('headers'))
 
     def post(self, url, data=None, params=None, **kwargs):
         """ http post simulation """
@@ -147,25 +684,62 @@ class FakeAPI():
         """ http delete simulation """
         return self.fake_call('delete', url)
 
-    def http_server(self, server='localhost', port=8080, http_prefix=None, start=True):
-        """ start http server """
+    def http_server(self, server='localhost', port=8080, http_prefix=None, start=True,
+                    engine='threading', workers=1, compress=True, admin=False, metrics=False,
+                    recorder=None):
+        """
+        start http server
+        engine: 'http' (one request at a time), 'threading' or 'asyncio' (to simulate latency)
+        workers: number of server processes (forked after url_config is indexed)
+        compress: negotiate gzip/deflate/br (if brotli installed) response compression
+        admin: enable /_fakeapi/routes endpoint to list and patch routes
+        metrics: enable /_fakeapi/metrics endpoint (requests, bytes, durations per route)
+        recorder: RecordingProxy forwarding requests to upstream api instead of url_config
+        """
         if http_prefix is None:
             http_prefix = f"http://{server}:{port}"
-        return fakeserver.FakeAPIServer(self, http_prefix, start, (server,port),
-                                        fakeserver.FakeAPIHTTPHandler)
+        if engine == 'http' and (self.latency or self.has_route_latency()):
+            logger.warning('http engine serves one request at a time, '
+                           'use asyncio engine to simulate latency')
+        http_server = fakeserver.engine_class(engine)(self, http_prefix, False, (server,port),
+                                                 fakeserver.FakeAPIHTTPHandler)
+        http_server.compress = compress
+        http_server.admin = admin
+        http_server.recorder = recorder
+        if metrics:
+            http_server.metrics = Metrics()
+        if start:
+            http_server.start(workers)
+        return http_server
+
+    def has_route_latency(self):
+        """ url_config routes define delay/throttling (not checked for LazyUrlConfig) """
+        if isinstance(self.url_config, LazyUrlConfig):
+            return False
+        return any(url_conf.get(key) for url_conf in self.url_config.values()
+                   for key in ('delay_ms', 'jitter_ms', 'bytes_per_s'))
+
+    def mock_for(self, method):
+        """ mock class for method: AsyncMock for async methods (AsyncFakeAPI) """
+        # unittest.mock, inspect are only imported when mocking (not on http server startup)
+        import inspect    # pylint: disable=C0415
+        from unittest.mock import AsyncMock, MagicMock    # pylint: disable=C0415
+        return AsyncMock if inspect.iscoroutinefunction(getattr(self, method)) else MagicMock
 
     def mock_class(self, apicli):
         """ to be called in unittest.TestCase.setUp() """
-        apicli.get    = MagicMock(side_effect=self.get)
-        apicli.post   = MagicMock(side_effect=self.post)
-        apicli.patch  = MagicMock(side_effect=self.patch)
-        apicli.put    = MagicMock(side_effect=self.put)
-        apicli.delete = MagicMock(side_effect=self.delete)
+        apicli.get    = self.mock_for('get')(side_effect=self.get)
+        apicli.post   = self.mock_for('post')(side_effect=self.post)
+        apicli.patch  = self.mock_for('patch')(side_effect=self.patch)
+        apicli.put    = self.mock_for('put')(side_effect=self.put)
+        apicli.delete = self.mock_for('delete')(side_effect=self.delete)
         return apicli
 
     def patch_method(self, test_case, module, method):
         """ mock module method """
-        patcher = patch(f'{module}.{method}', side_effect=getattr(self, method))
+        from unittest.mock import patch    # pylint: disable=C0415
+        patcher = patch(f'{module}.{method}', new_callable=self.mock_for(method),
+                        side_effect=getattr(self, method))
         mock = patcher.start()
         test_case.addCleanup(patcher.stop)
         return mock
@@ -183,6 +757,49 @@ class FakeAPI():
             setattr(mocks, method, self.patch_method(test_case, module, method))
         return mocks
 
+    def mock_requests(self, test_case, prefixes=('http://', 'https://'), record=False):
+        """
+        serve requests calls (requests.get/request, Session) to urls starting with prefixes
+        with FakeAPIAdapter, to be called in unittest.TestCase.setUp()
+        record: adapter keeps sent requests in adapter.calls
+        """
+        from .adapter import FakeAPIAdapter    # pylint: disable=C0415
+        adapter = FakeAPIAdapter(self, record)
+        adapter.patch_sessions(test_case, prefixes)
+        return adapter
+
+class AsyncFakeAPI(FakeAPI):
+    """
+    FakeAPI for asyncio clients (httpx.AsyncClient/aiohttp style)
+    get/post/put/patch/delete are coroutines returning FakeResponse,
+    mock_class/mock_module patch with AsyncMock
+    FakeAPI(sleep=True) delays are waited with asyncio.sleep
+    """
+
+    async def get(self, url, params=None, **kwargs):
+        """ http get simulation """
+        return await self.async_call('get', url, params=params, headers=kwargs.get('headers'))
+
+    async def post(self, url, data=None, params=None, **kwargs):
+        """ http post simulation, json= payload as httpx/aiohttp """
+        return await self.async_call('post', url, kwargs.get('json', data), params,
+                                     kwargs.get('headers'))
+
+    async def put(self, url, data=None, params=None, **kwargs):
+        """ http put simulation """
+        return await self.async_call('put', url, kwargs.get('json', data), params,
+                                     kwargs.get('headers'))
+
+    async def patch(self, url, data=None, params=None, **kwargs):
+        """ http patch simulation """
+        return await self.async_call('patch', url, kwargs.get('json', data), params,
+                                     kwargs.get('headers'))
+
+    async def delete(self, url, **kwargs):
+        """ http delete simulation """
+        return await self.async_call('delete', url, params=kwargs.get('params'),
+                                     headers=kwargs.get('headers'))
+
 class MockAPI:
     """mocks for requests calls"""
     get = None
@@ -0,0 +1,148 @@
+""" Fake API asyncio HTTP server (imported when asyncio engine is used) """
+# pylint: disable=C0103
+
+import time
+import socket
+import asyncio
+import threading
+from http import HTTPStatus
+from .fakelog import logger
+from .fakeserver import FakeAPIServerMixin, ChunkedBody, body_size, paced_chunks
+
+class FakeAPIAsyncServer(FakeAPIServerMixin):
+    """
+    asyncio HTTP server with fakeapi, all connections served by one event loop
+    same interface as HTTPServer (serve_forever/shutdown/server_close)
+    """
+    def __init__(self, fakeapi, http_prefix, start, server_address, RequestHandlerClass=None):
+        """ bind server_address, RequestHandlerClass is unused """
+        self.set_fakeapi(fakeapi, http_prefix)
+        self.server_address = server_address
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(server_address)
+        self.socket.listen(128)
+        host, self.server_port = self.socket.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self._loop = None
+        self._stop = None
+        self._writers = set()
+        self._stopped = threading.Event()
+        if start:
+            self.start()
+
+    def serve_forever(self):
+        """ run event loop until shutdown() """
+        self._stopped.clear()
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+            self._loop = None
+            self._stopped.set()
+
+    async def _serve(self):
+        """ accept connections on socket """
+        self._stop = asyncio.Event()
+        server = await asyncio.start_server(self.handle, sock=self.socket)
+        async with server:
+            await self._stop.wait()
+            for writer in list(self._writers):
+                writer.close()
+
+    def shutdown(self):
+        """ stop serve_forever loop (from another thread) """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._stopped.wait()
+
+    def server_close(self):
+        """ close listening socket """
+        self.socket.close()
+
+    async def handle(self, reader, writer):
+        """ serve http requests of connection """
+        self._writers.add(writer)
+        try:
+            while await self.handle_one_request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def handle_one_request(self, reader, writer):
+        """ read one http request and send response, returns keep-alive """
+        requestline = (await reader.readline()).decode('iso-8859-1').rstrip('\r\n')
+        start = time.perf_counter()
+        words = requestline.split()
+        if len(words) != 3:
+            return False
+        command, path, version = words
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('iso-8859-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+        payload = await reader.readexactly(int(headers.get('content-length') or 0))
+        if self.recorder is not None:
+            # upstream call is blocking, forwarded in a thread not to block other connections
+            status_code, response_headers, body, response = \
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.http_response, command, path, headers, payload)
+        else:
+            status_code, response_headers, body, response = self.http_response(
+                command, path, headers, payload)
+        if not response_headers:
+            response_headers = [('Content-Length', '0')]
+        if not keep_alive:
+            response_headers.append(('Connection', 'close'))
+        client = writer.get_extra_info('peername')[0]
+        logger.info('%s - "%s" %s -', client, requestline, int(status_code))
+        size = body_size(body)
+        delay, bytes_per_s = (response.delay, response.bytes_per_s) if response else (0, None)
+        if delay:
+            await asyncio.sleep(delay)
+        if bytes_per_s:
+            writer.write(self.response_head(status_code, response_headers))
+            start_body = asyncio.get_running_loop().time()
+            for chunk, due in paced_chunks(body, bytes_per_s):
+                await asyncio.sleep(start_body + due - asyncio.get_running_loop().time())
+                writer.write(chunk)
+                await writer.drain()
+            if not isinstance(body, bytes):
+                body.close()
+        elif isinstance(body, bytes):
+            writer.write(self.response_head(status_code, response_headers) + body)
+            await writer.drain()
+        elif isinstance(body, ChunkedBody):
+            writer.write(self.response_head(status_code, response_headers))
+            for chunk in body:
+                writer.write(chunk)
+                await writer.drain()
+        else:
+            with body:
+                writer.write(self.response_head(status_code, response_headers))
+                await writer.drain()
+                await asyncio.get_running_loop().sendfile(writer.transport, body)
+        if isinstance(body, ChunkedBody):
+            size = body.size
+        self.log_access(client, command, path, status_code, size, start, response)
+        return keep_alive
+
+    @staticmethod
+    def response_head(status_code, headers):
+        """ status line and headers """
+        try:
+            phrase = HTTPStatus(status_code).phrase
+        except ValueError:
+            phrase = ''
+        lines = [f'HTTP/1.1 {int(status_code)} {phrase}']
+        lines.extend(f'{name}: {value}' for name, value in headers)
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1')
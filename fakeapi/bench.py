@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+fakeapi benchmarks: python -m fakeapi.bench
+generates synthetic url_config with routes/payload sizes, measures:
+  in-process FakeAPI get/post calls per second
+  http server requests per second and p50/p99 latency with concurrent clients
+results are written as json to compare versions
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import http.client
+from .api import FakeAPI
+
+PREFIX = 'http://localhost'
+
+def make_url_config(routes, payload_size):
+    """
+    url_config with routes GET and POST urls and payload_size bytes data
+    GET routes share the same data list (memory is bounded by routes count, not payload)
+    """
+    url_config = {}
+    item = {'name': 'x' * 20, 'value': 0}
+    data = [dict(item, value=i) for i in range(max(1, payload_size // len(json.dumps(item))))]
+    for i in range(routes // 2 or 1):
+        url_config[f'GET {PREFIX}/api/items/{i}?fields=name&sort=value'] = {'data': data}
+        url_config[f'POST {PREFIX}/api/items?name=item{i}'] = {'data': {'id': i}}
+    return url_config
+
+def sample_calls(routes, count):
+    """ (method, path, data) calls on existing routes and some misses """
+    calls = []
+    for _ in range(count):
+        i = random.randrange(routes // 2 or 1)
+        if random.random() < 0.1:
+            calls.append(('get', f'/api/none/{i}', None))
+        elif random.random() < 0.5:
+            calls.append(('post', '/api/items', {'name': f'item{i}'}))
+        else:
+            calls.append(('get', f'/api/items/{i}?sort=value&fields=name', None))
+    return calls
+
+def percentile(values, pct):
+    """ pct percentile of sorted values """
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def bench_calls(api, calls):
+    """ in-process calls per second """
+    start = time.perf_counter()
+    for method, path, data in calls:
+        if method == 'get':
+            api.get(f'{PREFIX}{path}')
+        else:
+            api.post(f'{PREFIX}{path}', data)
+    return len(calls) / (time.perf_counter() - start)
+
+def bench_server(api, engine, calls, clients):
+    """ requests per second and latencies (ms) of http server, calls split between clients """
+    server = api.http_server(port=0, http_prefix=PREFIX, start=False, engine=engine)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    latencies = []
+
+    def client(client_calls):
+        """ send calls on a persistent connection """
+        conn = http.client.HTTPConnection('localhost', server.server_port, timeout=30)
+        client_latencies = []
+        for method, path, data in client_calls:
+            body = json.dumps(data) if data else None
+            start = time.perf_counter()
+            conn.request(method.upper(), path, body=body)
+            conn.getresponse().read()
+            client_latencies.append((time.perf_counter() - start) * 1000)
+        conn.close()
+        latencies.extend(client_latencies)
+
+    threads = [threading.Thread(target=client, args=(calls[i::clients],))
+               for i in range(clients)]
+    start = time.perf_counter()
+    for client_thread in threads:
+        client_thread.start()
+    for client_thread in threads:
+        client_thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+    latencies.sort()
+    return {
+        'requests_per_s': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+    }
+
+def run(routes_list, payloads, calls_count, requests_count, clients, engines, history):
+    """ run all benchmarks, returns results dict """
+    results = []
+    for routes in routes_list:
+        for payload_size in payloads:
+            url_config = make_url_config(routes, payload_size)
+            start = time.perf_counter()
+            api = FakeAPI(url_config, history=history)
+            result = {
+                'routes': len(url_config),
+                'payload_bytes': payload_size,
+                'index_s': round(time.perf_counter() - start, 4),
+                'calls_per_s': round(bench_calls(api, sample_calls(routes, calls_count)), 1),
+            }
+            for engine in engines:
+                result[engine] = bench_server(api, engine, sample_calls(routes, requests_count),
+                                              clients)
+            results.append(result)
+    return results
+
+def version():
+    """ fakeapi version """
+    try:
+        from ._version import __version__    # pylint: disable=C0415
+        return __version__.short()
+    except ImportError:
+        return None
+
+def main():
+    """ parse args, run benchmarks, output json """
+    parser = argparse.ArgumentParser(prog='python -m fakeapi.bench')
+    parser.add_argument("-r", "--routes", type=str, default='10,1000,100000',
+                        help="comma separated number of routes")
+    parser.add_argument("-b", "--payload", type=str, default='100,10000',
+                        help="comma separated payload sizes (bytes)")
+    parser.add_argument("-n", "--calls", type=int, default=20000,
+                        help="in-process calls per run")
+    parser.add_argument("-N", "--requests", type=int, default=2000,
+                        help="http requests per run")
+    parser.add_argument("-c", "--clients", type=int, default=8,
+                        help="concurrent http clients")
+    parser.add_argument("-e", "--engines", type=str, default='threading,asyncio',
+                        help="comma separated http server engines (empty for none)")
+    parser.add_argument("-H", "--history", type=str, default='counters',
+                        help="FakeAPI history mode")
+    parser.add_argument("-o", "--output", type=str, default='-',
+                        help="json results file")
+    args = parser.parse_args()
+    random.seed(0)
+    report = {
+        'fakeapi': version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': run([int(r) for r in args.routes.split(',')],
+                       [int(p) for p in args.payload.split(',')],
+                       args.calls, args.requests, args.clients,
+                       [e for e in args.engines.split(',') if e], args.history),
+    }
+    jsf = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    json.dump(report, jsf, indent=2)
+    jsf.write('\n')
+    if jsf is not sys.stdout:
+        jsf.close()
+
+if __name__ == '__main__':
+    main()
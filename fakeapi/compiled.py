@@ -0,0 +1,64 @@
+"""
+compiled url_config cache (FakeAPI(url_json=..., compiled_cache=True), --cache)
+url_config and its url_index are stored with marshal in <url_json>.fakeapi-cache,
+loaded with one mmap/unmarshal instead of json parsing and url canonicalization.
+cache is valid for json file mtime/size, or same content hash if file was touched,
+and for the python version that wrote it (marshal format is version specific)
+"""
+
+import os
+import gc
+import sys
+import mmap
+import marshal
+import hashlib
+from .fakelog import logger
+
+SUFFIX = '.fakeapi-cache'
+MAGIC = f'fakeapi-cache {sys.version_info[0]}.{sys.version_info[1]} {marshal.version}'
+
+def cache_path(url_json):
+    """ cache file path of json file """
+    return url_json + SUFFIX
+
+def file_hash(url_json):
+    """ json file content hash """
+    with open(url_json, 'rb') as jsf:
+        return hashlib.blake2b(jsf.read(), digest_size=16).hexdigest()
+
+def load(url_json):
+    """ (url_config, url_index) from cache, None if missing or stale """
+    gc_enabled = gc.isenabled()
+    gc.disable()    # no collections while creating the many containers of url_config
+    try:
+        stat = os.stat(url_json)
+        with open(cache_path(url_json), 'rb') as cache, \
+             mmap.mmap(cache.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            header, mtime_ns, size, digest, url_config, url_index = marshal.loads(buf)
+    except (OSError, ValueError, EOFError, TypeError) as exc:
+        logger.debug('no compiled cache for %s: %s', url_json, exc)
+        return None
+    finally:
+        if gc_enabled:
+            gc.enable()
+    if header != MAGIC:
+        return None
+    if (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size) and digest != file_hash(url_json):
+        return None
+    return url_config, url_index
+
+def save(url_json, url_config, url_index):
+    """ write cache of json file (atomic replace), False if not writable """
+    stat = os.stat(url_json)
+    path = cache_path(url_json)
+    tmp_path = f'{path}.{os.getpid()}'
+    data = marshal.dumps((MAGIC, stat.st_mtime_ns, stat.st_size, file_hash(url_json),
+                          dict(url_config), url_index))
+    try:
+        with open(tmp_path, 'wb') as cache:
+            cache.write(data)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        logger.warning('cannot write compiled cache %s: %s', path, exc)
+        return False
+    return True
@@ -0,0 +1,79 @@
+"""
+fakeapi logging
+'fakeapi' logger: calls and server messages (info), errors
+'fakeapi.access' logger: json lines access log of http server with request duration
+setup_logging() writes logs from a listener thread, request threads only enqueue records
+"""
+
+import os
+import sys
+import json
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+logger = logging.getLogger('fakeapi')
+access_logger = logging.getLogger('fakeapi.access')
+
+_listener = None
+
+class JsonFormatter(logging.Formatter):
+    """ json line with record time and access fields """
+
+    def format(self, record):
+        """ json line """
+        return json.dumps({'time': self.formatTime(record), **getattr(record, 'access', {})})
+
+def setup_logging(quiet=False, access_log=None):
+    """
+    log fakeapi messages to stderr and access log to access_log file ('-' for stderr)
+    quiet: only warnings and errors
+    """
+    stop_logging()
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('fakeapi: %(message)s'))
+    handler.addFilter(lambda record: record.name != access_logger.name)
+    handlers = [handler]
+    if access_log:
+        access_handler = (logging.StreamHandler(sys.stderr) if access_log == '-'
+                          else logging.FileHandler(access_log, encoding='utf-8'))
+        access_handler.setFormatter(JsonFormatter())
+        access_handler.addFilter(logging.Filter(access_logger.name))
+        handlers.append(access_handler)
+    logger.setLevel(logging.WARNING if quiet else logging.INFO)
+    access_logger.setLevel(logging.INFO if access_log else logging.WARNING)
+    logger.propagate = False
+    logger.addHandler(QueueHandler(queue.SimpleQueue()))
+    _start_listener(handlers)
+
+def _start_listener(handlers):
+    """ start thread writing queued records to handlers """
+    global _listener    # pylint: disable=W0603
+    queue_handler = logger.handlers[-1]
+    queue_handler.queue = queue.SimpleQueue()
+    _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+def _restart_listener():
+    """ listener thread does not survive fork """
+    if _listener is not None:
+        _start_listener(_listener.handlers)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener)
+
+def stop_logging():
+    """ flush queued records and remove handlers set by setup_logging """
+    global _listener    # pylint: disable=W0603
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    for handler in list(logger.handlers):
+        if isinstance(handler, QueueHandler):
+            logger.removeHandler(handler)
+    logger.propagate = True
+    logger.setLevel(logging.NOTSET)
+    access_logger.setLevel(logging.NOTSET)
@@ -1,47 +1,427 @@
 """ Fake API HTTP server class"""
 # pylint: disable=C0103
 
+import os
+import gc
 import sys
 import json
+import time
+import signal
+import logging
+import threading
+from http import HTTPStatus
+from socketserver import ThreadingMixIn
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from .fakelog import logger, access_logger, stop_logging
+from .routes import COMPRESSORS, compress
+from .metrics import MISS
+
+ALLOW = 'GET, HEAD, POST, PUT, PATCH, DELETE, OPTIONS'
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+ADMIN_PATH = '/_fakeapi/'
+ENCODINGS = [encoding for encoding in ('br', 'gzip', 'deflate') if encoding in COMPRESSORS]
+
+class UnsupportedMethod(Exception):
+    """ http method not supported by fakeapi (501) """
+
+class BadPayload(Exception):
+    """ request payload is not json (400) """
+
+def accepted_encoding(accept_encoding):
+    """ preferred supported encoding in Accept-Encoding header """
+    accepted = {}
+    for coding in (accept_encoding or '').lower().split(','):
+        name, _, qvalue = coding.partition(';')
+        qvalue = qvalue.strip()
+        try:
+            accepted[name.strip()] = float(qvalue[2:]) if qvalue.startswith('q=') else 1.0
+        except ValueError:
+            continue
+    default = accepted.get('*', 0)
+    qvalue, _, encoding = max(((accepted.get(enc, default), -i, enc)
+                               for i, enc in enumerate(ENCODINGS)), default=(0, 0, None))
+    return encoding if qvalue > 0 else None
+
+class ChunkedBody():
+    """ body chunks iterator sent with chunked transfer encoding, size is counted when sent """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.size = 0
+
+    def __iter__(self):
+        """ chunked transfer encoding frames, last one empty """
+        for chunk in self.chunks:
+            if chunk:
+                self.size += len(chunk)
+                yield b'%x\r\n%s\r\n' % (len(chunk), chunk)
+        yield b'0\r\n\r\n'
+
+    def close(self):
+        """ stop chunks generator """
+        close = getattr(self.chunks, 'close', None)
+        if close:
+            close()
+
+def body_size(body):
+    """ size of bytes or file body, bytes sent of chunked body """
+    if isinstance(body, bytes):
+        return len(body)
+    if isinstance(body, ChunkedBody):
+        return body.size
+    return os.fstat(body.fileno()).st_size
+
+def paced_chunks(body, bytes_per_s):
+    """ (chunk, seconds from start of body when chunk is sent) to send body at bytes_per_s """
+    size = max(1, int(bytes_per_s) // 10)
+    sent = 0
+    if isinstance(body, ChunkedBody):
+        for chunk in body:
+            sent += len(chunk)
+            yield chunk, sent / bytes_per_s
+        return
+    while True:
+        chunk = body[sent:sent + size] if isinstance(body, bytes) else body.read(size)
+        if not chunk:
+            return
+        sent += len(chunk)
+        yield chunk, sent / bytes_per_s
 
 class FakeAPIHTTPHandler(BaseHTTPRequestHandler):
     """ Class handler for HTTP """
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1    # headers and body in one send, flushed after each request
 
-    def _set_response(self, status_code, data):
-        """ set response """
+    def _set_response(self, status_code, headers, body, response=None):
+        """
+        set response, file body is sent with sendfile
+        waits response delay and sends body at response bytes_per_s (simulated latency),
+        in the connection thread (asyncio engine waits without blocking other connections)
+        """
+        delay, bytes_per_s = (response.delay, response.bytes_per_s) if response else (0, None)
+        if delay:
+            time.sleep(delay)
         self.send_response(status_code)
-        self.send_header('Content-type', self.server.content_type)
+        for name, value in headers:
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(str(data).encode('utf-8'))
+        if bytes_per_s:
+            self.wfile.flush()
+            start = time.monotonic()
+            for chunk, due in paced_chunks(body, bytes_per_s):
+                wait = start + due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                self.wfile.write(chunk)
+                self.wfile.flush()
+            if not isinstance(body, bytes):
+                body.close()
+            return
+        if isinstance(body, bytes):
+            self.wfile.write(body)
+            return
+        if isinstance(body, ChunkedBody):
+            for chunk in body:
+                self.wfile.write(chunk)
+            return
+        with body:
+            self.wfile.flush()
+            self.connection.sendfile(body)
 
     def do_ALL(self):
         """ do http calls """
-        self.log_message('%s http://%s%s', self.command, self.headers['Host'], self.path)
+        start = time.perf_counter()
         content_length = int(self.headers['Content-Length'] or 0)
-        payload_text = self.rfile.read(content_length).decode('utf-8')
-        payload = json.loads(payload_text or 'null')
-        call = getattr(self.server.fakeapi, f'{self.command.lower()}')
-        response = call(f'{self.server.http_prefix}{self.path}', data=payload)
-        self._set_response(response.status_code, response.text)
-
-    do_GET    = do_ALL
-    do_POST   = do_ALL
-    do_PUT    = do_ALL
-    do_DELETE = do_ALL
-
-class FakeAPIServer(HTTPServer):
-    """ HTTPServer with fakeapi """
-    def __init__(self, fakeapi, http_prefix, start, *args, **kwargs):
+        status_code, headers, body, response = self.server.http_response(
+            self.command, self.path, self.headers, self.rfile.read(content_length))
+        size = body_size(body)
+        self._set_response(status_code, headers, body, response)
+        if isinstance(body, ChunkedBody):
+            size = body.size
+        self.server.log_access(self.client_address[0], self.command, self.path, status_code,
+                               size, start, response)
+
+    def log_message(self, format, *args):    # pylint: disable=W0622
+        """ log to fakeapi logger """
+        logger.info('%s - %s', self.address_string(), format % args)
+
+    def log_error(self, format, *args):    # pylint: disable=W0622
+        """ log errors to fakeapi logger """
+        logger.warning('%s - %s', self.address_string(), format % args)
+
+    do_GET     = do_ALL
+    do_HEAD    = do_ALL
+    do_POST    = do_ALL
+    do_PUT     = do_ALL
+    do_PATCH   = do_ALL
+    do_DELETE  = do_ALL
+    do_OPTIONS = do_ALL
+
+class FakeAPIServerMixin():
+    """ fakeapi calls and start common to all server engines """
+    keep_alive = True
+    compress = True
+    compress_min_size = 1024
+    admin = False
+    metrics = None
+    recorder = None
+
+    def set_fakeapi(self, fakeapi, http_prefix):
         """ add fakeapi property """
         self.fakeapi = fakeapi
         self.http_prefix = http_prefix
         self.content_type = 'application/json'
+
+    def fakeapi_call(self, command, path, payload_bytes, headers=None):
+        """
+        FakeResponse to http command on path with payload
+        response delay is not waited here (FakeAPI sleep), engines wait it before sending
+        """
+        method = command.lower()
+        if method not in ('get', 'post', 'put', 'patch', 'delete'):
+            raise UnsupportedMethod(f'{command} not supported')
+        try:
+            payload = json.loads(payload_bytes.decode('utf-8') or 'null')
+        except ValueError as error:
+            raise BadPayload(str(error)) from error
+        if method in ('get', 'delete'):
+            payload = None
+        return self.fakeapi.fake_response(method, f'{self.http_prefix}{path}', payload,
+                                          headers=headers)[0]
+
+    def log_access(self, client, command, path, status_code, size, start, response=None):
+        """
+        json access log with duration since start (perf_counter)
+        and metrics of fakeapi responses (if enabled)
+        """
+        if self.metrics is not None and response is not None:
+            if response.route:
+                route = response.route.url_method
+            else:
+                route = response.resource.url_method if response.resource else MISS
+            self.metrics.observe(route, int(status_code), size, time.perf_counter() - start)
+        if access_logger.isEnabledFor(logging.INFO):
+            access_logger.info('access', extra={'access': {
+                'client': client, 'method': command, 'path': path,
+                'status': int(status_code), 'bytes': size,
+                'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            }})
+
+    def admin_response(self, command, path, headers, payload_bytes):
+        """
+        (status_code, headers, body, None) of admin endpoints:
+        GET /_fakeapi/metrics: prometheus text metrics, json if ?format=json (metrics enabled)
+        GET /_fakeapi/routes: url_config keys (admin enabled)
+        PATCH /_fakeapi/routes {"METHOD url": url_conf or null to remove}: update routes
+        """
+        path, _, query = path.partition('?')
+        if path == 'metrics' and command == 'GET' and self.metrics is not None:
+            if 'format=json' in query or 'json' in (headers.get('accept') or ''):
+                status_code, result = HTTPStatus.OK, self.metrics.to_json()
+            else:
+                body = self.metrics.to_prometheus().encode('utf-8')
+                return HTTPStatus.OK, [('Content-type', 'text/plain; version=0.0.4'),
+                                       ('Content-Length', str(len(body)))], body, None
+        elif path != 'routes' or command not in ('GET', 'PATCH') or not self.admin:
+            status_code, result = HTTPStatus.NOT_FOUND, {'error': f'{command} {path} unknown'}
+        elif command == 'GET':
+            status_code, result = HTTPStatus.OK, list(self.fakeapi.url_config)
+        else:
+            try:
+                routes = json.loads(payload_bytes.decode('utf-8'))
+                if not isinstance(routes, dict):
+                    raise ValueError('routes patch must be a json object')
+                for url_method, url_conf in routes.items():
+                    if url_conf is not None and not isinstance(url_conf, dict):
+                        raise ValueError(f'{url_method}: route must be a json object or null')
+                url_config = dict(self.fakeapi.url_config)
+                for url_method, url_conf in routes.items():
+                    if url_conf is None:
+                        url_config.pop(url_method, None)
+                    else:
+                        url_config[url_method] = url_conf
+                status_code, result = HTTPStatus.OK, self.fakeapi.update_config(url_config)
+            except ValueError as error:    # invalid json or route (body matcher)
+                status_code, result = HTTPStatus.BAD_REQUEST, {'error': str(error)}
+        body = json.dumps(result).encode('utf-8')
+        return status_code, [('Content-type', 'application/json'),
+                             ('Content-Length', str(len(body)))], body, None
+
+    def http_response(self, command, path, headers, payload_bytes):
+        """
+        (status_code, headers, body, response) for http command on path
+        body is bytes or opened file for file routes (to be closed by caller)
+        response is the FakeResponse (None for OPTIONS, admin endpoints and errors)
+        HEAD is answered as GET without body
+        unsupported method: 501, invalid json payload: 400 (same for all engines),
+        other errors (route or server error) are logged: 500
+        connections not kept alive are closed after each response (http engine)
+        """
+        try:
+            status_code, response_headers, body, response = self.route_response(
+                command, path, headers, payload_bytes)
+        except UnsupportedMethod:
+            status_code = HTTPStatus.NOT_IMPLEMENTED
+        except BadPayload:
+            status_code = HTTPStatus.BAD_REQUEST
+        except Exception:    # pylint: disable=W0703
+            logger.exception('%s %s failed', command, path)
+            status_code = HTTPStatus.INTERNAL_SERVER_ERROR
+        else:
+            if not self.keep_alive:
+                response_headers.append(('Connection', 'close'))
+            return status_code, response_headers, body, response
+        response_headers = [('Content-Length', '0')]
+        if not self.keep_alive:
+            response_headers.append(('Connection', 'close'))
+        return status_code, response_headers, b'', None
+
+    def route_response(self, command, path, headers, payload_bytes):
+        """ http_response of command on path (admin, recorder, OPTIONS or url_config routes) """
+        if (self.admin or self.metrics is not None) and path.startswith(ADMIN_PATH):
+            return self.admin_response(command, path[len(ADMIN_PATH):], headers, payload_bytes)
+        if self.recorder is not None:
+            return self.recorder.http_response(command, path, headers, payload_bytes)
+        if command == 'OPTIONS':
+            return HTTPStatus.NO_CONTENT, [('Allow', ALLOW)], b'', None
+        response = self.fakeapi_call('GET' if command == 'HEAD' else command, path, payload_bytes,
+                                     headers)
+        status_code = response.status_code
+        if status_code == HTTPStatus.NOT_MODIFIED:
+            return status_code, [(name, value) for name, value in response.headers.items()
+                                 if name in ('ETag', 'Last-Modified')], b'', response
+        if response.file:
+            try:
+                body = open(response.file, 'rb')    # pylint: disable=R1732
+            except OSError as error:
+                logger.warning('%s', error)
+                status_code, body = HTTPStatus.NOT_FOUND, b''
+        elif response.chunks is not None:
+            body = ChunkedBody(response.chunks())
+        else:
+            body = response.content
+        response_headers = [('Content-type', response.headers.get('Content-Type',
+                                                                  self.content_type))]
+        response_headers.extend((name, value) for name, value in response.headers.items()
+                                if name != 'Content-Type')
+        if self.compress and isinstance(body, bytes) and len(body) >= self.compress_min_size:
+            encoding = accepted_encoding(headers.get('accept-encoding'))
+            if encoding:
+                route = response.route
+                if route and not route.template:
+                    body = route.encoded(encoding)
+                else:
+                    body = compress(body, encoding)
+                response_headers.append(('Content-Encoding', encoding))
+            response_headers.append(('Vary', 'Accept-Encoding'))
+        if isinstance(body, ChunkedBody):
+            response_headers.append(('Transfer-Encoding', 'chunked'))
+        else:
+            response_headers.append(('Content-Length', str(body_size(body))))
+        if command == 'HEAD':
+            if not isinstance(body, bytes):
+                body.close()
+            body = b''
+        return status_code, response_headers, body, response
+
+    def start(self, workers=1):
+        """
+        serve until SIGINT/SIGTERM then stop gracefully
+        workers > 1: fork worker processes sharing the listening socket
+        """
+        logger.info('Starting http server : http://%s:%s', self.server_name, self.server_port)
+        if workers > 1:
+            self.serve_workers(workers)
+        else:
+            self.serve_until_signal()
+        logger.info('Stopping http server')
+
+    def serve_until_signal(self):
+        """
+        serve_forever in thread until SIGINT/SIGTERM, then shutdown
+        (out of main thread, serve_forever until shutdown() is called)
+        """
+        if threading.current_thread() is not threading.main_thread():
+            self.serve_forever()
+            return
+        stop = threading.Event()
+        handlers = {signum: signal.signal(signum, lambda *_: stop.set())
+                    for signum in STOP_SIGNALS}
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        try:
+            stop.wait()
+        finally:
+            self.shutdown()
+            thread.join()
+            self.server_close()
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def serve_workers(self, workers):
+        """
+        fork workers processes serving the listening socket
+        url_config index is shared copy-on-write, each worker has its own calls history
+        stop workers on SIGINT/SIGTERM, stop when all workers exited
+        """
+        sys.stdout.flush()
+        sys.stderr.flush()
+        gc.freeze()
+        pids = []
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    self.serve_until_signal()
+                finally:
+                    stop_logging()
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    os._exit(0)
+            pids.append(pid)
+        stop = threading.Event()
+        handlers = {signum: signal.signal(signum, lambda *_: stop.set())
+                    for signum in STOP_SIGNALS}
+        try:
+            while pids and not stop.wait(0.5):
+                pids = [pid for pid in pids if os.waitpid(pid, os.WNOHANG)[0] == 0]
+        finally:
+            for pid in pids:
+                os.kill(pid, signal.SIGTERM)
+            for pid in pids:
+                os.waitpid(pid, 0)
+            self.server_close()
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            gc.unfreeze()
+
+class FakeAPIServer(FakeAPIServerMixin, HTTPServer):
+    """
+    HTTPServer with fakeapi, one request at a time
+    connections are not kept alive not to block other clients
+    """
+    keep_alive = False
+
+    def __init__(self, fakeapi, http_prefix, start, *args, **kwargs):
+        """ add fakeapi property """
+        self.set_fakeapi(fakeapi, http_prefix)
         super().__init__(*args, **kwargs)
         if start:
-            print(f'Starting http server : http://{self.server_name}:{self.server_port}')
-            try:
-                self.serve_forever()
-            except KeyboardInterrupt:
-                print('Stopping http server')
-                sys.exit(0)
+            self.start()
+
+class FakeAPIThreadingServer(ThreadingMixIn, FakeAPIServer):
+    """ FakeAPIServer with one thread per connection """
+    daemon_threads = True
+    keep_alive = True
+
+ENGINES = {
+    'http': FakeAPIServer,
+    'threading': FakeAPIThreadingServer,
+}
+
+def engine_class(engine):
+    """ server class of engine, asyncio engine is imported when used """
+    if engine == 'asyncio':
+        from .asyncserver import FakeAPIAsyncServer    # pylint: disable=C0415
+        return FakeAPIAsyncServer
+    return ENGINES[engine]
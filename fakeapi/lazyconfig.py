@@ -0,0 +1,81 @@
+"""
+url_config loaded lazily from json lines file, one route per line:
+["GET http://localhost/api", {"status_code": 200, "data": {...}}]
+
+At load, only 'METHOD url' keys are decoded to index their line offsets in the
+mmapped file, route conf is parsed when first requested and kept in a LRU cache.
+"""
+
+import json
+import mmap
+from collections.abc import Mapping
+from .routes import LRUCache
+
+_decoder = json.JSONDecoder()
+
+class LazyUrlConfig(Mapping):
+    """ read-only url_config mapping from json lines file """
+    version = 0    # never modified (see UrlConfig)
+
+    def __init__(self, jsonl_file, cache_size=1024):
+        """ index 'METHOD url' keys of jsonl_file, cache_size: parsed routes kept """
+        self.jsonl_file = jsonl_file
+        self.cache_size = cache_size
+        self._cache = LRUCache(cache_size)
+        self.offsets = {}
+        self._mmap = None
+        with open(jsonl_file, 'rb') as jsf:
+            if jsf.seek(0, 2):
+                self._mmap = mmap.mmap(jsf.fileno(), 0, access=mmap.ACCESS_READ)
+                self._index()
+
+    def _index(self):
+        """ offsets of lines by key """
+        mm = self._mmap
+        start, size = 0, len(mm)
+        while start < size:
+            end = mm.find(b'\n', start)
+            if end == -1:
+                end = size
+            if mm[start:end].strip():
+                self.offsets[self._line_key(start, end)] = (start, end)
+            start = end + 1
+
+    def _line_key(self, start, end):
+        """ decode only key string at start of line """
+        prefix = self._mmap[start:min(end, start + 4096)].decode('utf-8', 'ignore')
+        try:
+            return _decoder.raw_decode(prefix, prefix.index('"'))[0]
+        except ValueError:
+            return json.loads(self._mmap[start:end])[0]
+
+    def __getitem__(self, key):
+        """ route conf parsed from file on first access """
+        url_conf = self._cache.get(key)
+        if url_conf is None:
+            start, end = self.offsets[key]
+            url_conf = json.loads(self._mmap[start:end])[1]
+            self._cache[key] = url_conf
+        return url_conf
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def close(self):
+        """ close mmapped file """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+def write_jsonl(url_config, jsonl_file):
+    """ save url_config dict as json lines file for LazyUrlConfig """
+    with open(jsonl_file, 'w', encoding='utf-8') as jsf:
+        for url_method, url_conf in url_config.items():
+            jsf.write(json.dumps([url_method, url_conf]))
+            jsf.write('\n')
@@ -0,0 +1,110 @@
+"""
+request body matchers of url_config routes:
+"POST http://localhost/api/users#admin": {"body": {"json": {"name": "admin"}}, "data": ...}
+  json:   body equal to json value (compared as canonical json: sorted keys, no spaces)
+  subset: json body containing values at their paths, {"user": {"role": "admin"}} matches
+          {"user": {"id": 1, "role": "admin"}, ...}, lists and scalars are compared as is
+  regex:  body text matching regex (re.search), json bodies as canonical json text
+routes of the same url are distinguished by url fragment (#admin), which is not part of url.
+matchers are compiled when url_config is indexed, the called body is canonicalized and
+hashed once: exact bodies are found by hash lookup, then subsets and regexes are tried
+in url_config order, then the route of url without body matcher is used
+"""
+
+import re
+import json
+import hashlib
+
+BODY = 'body'
+MATCHERS = ('json', 'subset', 'regex')
+
+def canonical_json(data):
+    """ json text of data independent of keys order and spacing """
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+def body_hash(text):
+    """ hash of canonical body text """
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+def subset_paths(subset, path=()):
+    """ [(path, value)] leaves of subset json object """
+    if not isinstance(subset, dict):
+        return [(path, subset)]
+    paths = []
+    for name, value in subset.items():
+        paths.extend(subset_paths(value, path + (name,)))
+    return paths
+
+class RequestBody():
+    """ called body (data/payload), canonical text and hash computed once """
+    __slots__ = ('data', '_text', '_hash')
+
+    def __init__(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                pass
+        self.data = data
+        self._text = None
+        self._hash = None
+
+    @property
+    def text(self):
+        """ body text, canonical json of json bodies """
+        if self._text is None:
+            self._text = self.data if isinstance(self.data, str) else canonical_json(self.data)
+        return self._text
+
+    @property
+    def hash(self):
+        """ hash of canonical body text """
+        if self._hash is None:
+            self._hash = body_hash(self.text)
+        return self._hash
+
+    def has(self, path, value):
+        """ json body has value at path """
+        node = self.data
+        for name in path:
+            if not isinstance(node, dict) or name not in node:
+                return False
+            node = node[name]
+        return node == value
+
+class BodyMatchers():
+    """ compiled body matchers of the routes of one url """
+    __slots__ = ('exact', 'subsets', 'regexes')
+
+    def __init__(self):
+        self.exact = {}      # body hash: url_method
+        self.subsets = []    # ([(path, value)], url_method)
+        self.regexes = []    # (compiled regex, url_method)
+
+    def add(self, matcher, url_method):
+        """ compile body matcher {"json"|"subset"|"regex": value} of url_method route """
+        if not isinstance(matcher, dict) or len(matcher) != 1 or list(matcher)[0] not in MATCHERS:
+            raise ValueError(f'{url_method}: body matcher must be one of {MATCHERS}')
+        kind, value = next(iter(matcher.items()))
+        if kind == 'json':
+            self.exact.setdefault(body_hash(canonical_json(value)), url_method)
+        elif kind == 'subset':
+            self.subsets.append((subset_paths(value), url_method))
+        else:
+            self.regexes.append((re.compile(value), url_method))
+
+    def match(self, body):
+        """ url_method of first route matching RequestBody, None if none matches """
+        if self.exact:
+            url_method = self.exact.get(body.hash)
+            if url_method is not None:
+                return url_method
+        for paths, url_method in self.subsets:
+            if all(body.has(path, value) for path, value in paths):
+                return url_method
+        for regex, url_method in self.regexes:
+            if regex.search(body.text):
+                return url_method
+        return None
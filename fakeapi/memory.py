@@ -0,0 +1,58 @@
+"""
+memory used by FakeAPI url_config, indexes, cached routes/responses and history
+sizes are sys.getsizeof of reachable objects, objects shared between parts are counted once
+"""
+
+import sys
+import types
+from collections import deque
+from .routes import BodyStore
+
+_SKIP = (type, types.FunctionType, types.MethodType, types.ModuleType, BodyStore)
+
+def deep_sizeof(obj, seen):
+    """ size of obj and objects it references, not already in seen ids """
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SKIP):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+            continue
+        if isinstance(obj, dict):
+            for key, value in obj.items():
+                stack.append(key)
+                stack.append(value)
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        if hasattr(obj, '__dict__'):
+            stack.append(vars(obj))
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if name != '__weakref__' and hasattr(obj, name):
+                    stack.append(getattr(obj, name))
+    return size
+
+def memory_report(api):
+    """ dict of bytes used by api parts and per route """
+    seen = set()
+    routes_count = len(api.url_config)
+    report = {
+        'routes': routes_count,
+        'url_config_bytes': deep_sizeof(api.url_config, seen),
+        'index_bytes': deep_sizeof((api.url_index, api.url_trie, api.resources, api.body_index),
+                                   seen),
+        'bodies': len(api.bodies),
+        'bodies_bytes': deep_sizeof(api.bodies.values(), seen),
+        'cached_routes': len(api.routes),
+        'cached_routes_bytes': deep_sizeof(api.routes, seen),
+        'history_bytes': deep_sizeof((api.url_calls, api.url_history, api.url_history_full,
+                                      api.responses), seen),
+    }
+    report['total_bytes'] = sum(value for name, value in report.items()
+                                if name.endswith('_bytes'))
+    report['bytes_per_route'] = round(report['total_bytes'] / routes_count) if routes_count else 0
+    return report
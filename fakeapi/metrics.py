@@ -0,0 +1,137 @@
+"""
+http server metrics (--metrics, /_fakeapi/metrics endpoint)
+requests count, bytes sent and duration histogram per route and status code
+each thread updates its own counters without lock, they are summed when collected,
+counters of finished threads (threading engine: one thread per connection) are merged
+"""
+
+import json
+import time
+import bisect
+import threading
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MISS = ''    # route label of calls to urls not in url_config
+
+class Metrics():
+    """ per route/status counters, one counters dict per thread """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.started = time.time()
+        self._local = threading.local()
+        self._shards = []     # (thread, counters) of threads having served requests
+        self._finished = {}   # counters of finished threads
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        """ counters dict of current thread """
+        shard = getattr(self._local, 'counters', None)
+        if shard is None:
+            shard = self._local.counters = {}
+            with self._lock:
+                self._merge_finished()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _merge_finished(self):
+        """ merge counters of finished threads in _finished (with lock) """
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._add(self._finished, shard)
+        self._shards = alive
+
+    @staticmethod
+    def _add(totals, shard):
+        """ add shard counters to totals """
+        for key, counters in shard.items():
+            total = totals.get(key)
+            if total is None:
+                totals[key] = list(counters)
+            else:
+                for i, value in enumerate(counters):
+                    total[i] += value
+
+    def observe(self, route, status_code, size, duration):
+        """ count request on route (url_config key or MISS) """
+        shard = self._shard()
+        counters = shard.get((route, status_code))
+        if counters is None:
+            # count, bytes, duration sum, buckets counts (last is +Inf)
+            counters = shard[(route, status_code)] = [0, 0, 0.0] + [0] * (len(self.buckets) + 1)
+        counters[0] += 1
+        counters[1] += size
+        counters[2] += duration
+        counters[3 + bisect.bisect_left(self.buckets, duration)] += 1
+
+    def collect(self):
+        """ {(route, status_code): counters} summed over threads """
+        with self._lock:
+            self._merge_finished()
+            shards = [shard.copy() for _, shard in self._shards]
+            totals = {key: list(counters) for key, counters in self._finished.items()}
+        for shard in shards:
+            self._add(totals, shard)
+        return totals
+
+    def to_json(self):
+        """ metrics dict by route: hits, status codes, bytes, duration histogram """
+        routes = {}
+        misses = 0
+        for (route, status_code), counters in sorted(self.collect().items()):
+            if route == MISS:
+                misses += counters[0]
+            stats = routes.setdefault(route, {
+                'hits': 0, 'status': {}, 'bytes': 0, 'duration_s': 0.0,
+                'buckets': [0] * (len(self.buckets) + 1),
+            })
+            stats['hits'] += counters[0]
+            stats['status'][str(status_code)] = counters[0]
+            stats['bytes'] += counters[1]
+            stats['duration_s'] += counters[2]
+            stats['buckets'] = [total + count for total, count in
+                                zip(stats['buckets'], counters[3:])]
+        return {
+            'uptime_s': round(time.time() - self.started, 3),
+            'misses': misses,
+            'buckets': list(self.buckets) + ['+Inf'],
+            'routes': routes,
+        }
+
+    def to_prometheus(self):
+        """ prometheus text exposition format """
+        lines = [
+            '# HELP fakeapi_requests_total Requests by route and status code.',
+            '# TYPE fakeapi_requests_total counter',
+        ]
+        totals = sorted(self.collect().items())
+        for (route, status_code), counters in totals:
+            lines.append(f'fakeapi_requests_total{{route={json.dumps(route)},'
+                         f'status="{status_code}"}} {counters[0]}')
+        lines += [
+            '# HELP fakeapi_misses_total Requests on urls not in url_config.',
+            '# TYPE fakeapi_misses_total counter',
+            f'fakeapi_misses_total {sum(c[0] for (r, _), c in totals if r == MISS)}',
+            '# HELP fakeapi_response_bytes_total Response body bytes sent.',
+            '# TYPE fakeapi_response_bytes_total counter',
+        ]
+        for (route, status_code), counters in totals:
+            lines.append(f'fakeapi_response_bytes_total{{route={json.dumps(route)},'
+                         f'status="{status_code}"}} {counters[1]}')
+        lines += [
+            '# HELP fakeapi_request_duration_seconds Request handling duration.',
+            '# TYPE fakeapi_request_duration_seconds histogram',
+        ]
+        for (route, status_code), counters in totals:
+            labels = f'route={json.dumps(route)},status="{status_code}"'
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ['+Inf'], counters[3:]):
+                cumulative += count
+                lines.append(f'fakeapi_request_duration_seconds_bucket{{{labels},le="{bound}"}} '
+                             f'{cumulative}')
+            lines.append(f'fakeapi_request_duration_seconds_sum{{{labels}}} {counters[2]:.6f}')
+            lines.append(f'fakeapi_request_duration_seconds_count{{{labels}}} {counters[0]}')
+        return '\n'.join(lines) + '\n'
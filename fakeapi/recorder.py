@@ -0,0 +1,155 @@
+"""
+recording reverse proxy (python -m fakeapi --record UPSTREAM calls.jsonl)
+requests are forwarded to upstream api with pooled keep-alive connections,
+each exchange is appended to a json lines file as soon as it is received:
+["GET http://upstream/api?id=1", {"status_code": 200, "data": {...}}]
+the file is a url_config usable as is (LazyUrlConfig, FakeAPI(url_json=...)),
+last recorded exchange of a url wins
+"""
+
+import os
+import json
+import queue
+import hashlib
+import threading
+import http.client
+from http import HTTPStatus
+from urllib.parse import urlsplit
+from . import urlfunc
+from .fakelog import logger
+
+HOP_HEADERS = {'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'te',
+               'trailer', 'upgrade', 'content-length', 'host', 'accept-encoding'}
+SKIP_RESPONSE_HEADERS = HOP_HEADERS | {'date', 'server'}    # set by proxy server
+
+class RecordingProxy():
+    """ forward http requests to upstream, record them in jsonl_file """
+
+    def __init__(self, upstream, jsonl_file, http_prefix=None, pool_size=16, timeout=30):
+        """
+        upstream: upstream api url (http[s]://host[:port][/base/path])
+        http_prefix: url prefix of recorded urls (default upstream)
+        pool_size: idle upstream connections kept
+        """
+        parts = urlsplit(upstream)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise ValueError(f'invalid upstream url {upstream}')
+        self.connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.netloc = parts.netloc
+        self.base_path = parts.path.rstrip('/')
+        self.http_prefix = (http_prefix or upstream).rstrip('/')
+        self.timeout = timeout
+        self.jsonl_file = jsonl_file
+        self.files_dir = f'{jsonl_file}.files'
+        self.recorded = 0
+        self._pool = queue.LifoQueue(pool_size)
+        self._lock = threading.Lock()
+        self._jsf = open(jsonl_file, 'a', encoding='utf-8')    # pylint: disable=R1732
+
+    def _connection(self):
+        """ idle pooled connection or new one """
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self.connection_class(self.netloc, timeout=self.timeout)
+
+    def _release(self, conn, response):
+        """ keep connection in pool if reusable """
+        if response.will_close:
+            conn.close()
+            return
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def forward(self, command, path, headers, payload_bytes):
+        """ (status_code, headers, body) of upstream response """
+        request_headers = {name: value for name, value in headers.items()
+                           if name.lower() not in HOP_HEADERS}
+        for retry in (True, False):
+            conn = self._connection()
+            try:
+                conn.request(command, f'{self.base_path}{path}', body=payload_bytes or None,
+                             headers=request_headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                conn.close()
+                if retry:    # stale pooled connection
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            self._release(conn, response)
+            return response.status, response.getheaders(), body
+        return None    # not reached
+
+    def http_response(self, command, path, headers, payload_bytes):
+        """ (status_code, headers, body, None) of upstream response, recorded """
+        try:
+            status_code, upstream_headers, body = self.forward(command, path, headers,
+                                                               payload_bytes)
+        except (OSError, http.client.HTTPException) as error:
+            logger.warning('upstream %s %s failed: %s', command, path, error)
+            body = json.dumps({'error': str(error)}).encode('utf-8')
+            return HTTPStatus.BAD_GATEWAY, [('Content-type', 'application/json'),
+                                            ('Content-Length', str(len(body)))], body, None
+        response_headers = [(name, value) for name, value in upstream_headers
+                            if name.lower() not in SKIP_RESPONSE_HEADERS]
+        self.record(command, path, payload_bytes, status_code, dict(response_headers), body)
+        response_headers.append(('Content-Length', str(len(body))))
+        return status_code, response_headers, body, None
+
+    def record(self, command, path, payload_bytes, status_code, headers, body):
+        """ append exchange to jsonl_file as url_config line """
+        try:
+            payload = json.loads(payload_bytes.decode('utf-8') or 'null')
+        except ValueError:
+            payload = None
+        url_conf = {'status_code': status_code}
+        content_type = next((value for name, value in headers.items()
+                             if name.lower() == 'content-type'), '')
+        if body and 'json' in content_type:
+            try:
+                url_conf['data'] = json.loads(body)
+            except ValueError:
+                pass
+        if 'data' not in url_conf and body:
+            if content_type:
+                url_conf['content_type'] = content_type
+            try:
+                url_conf['data'] = body.decode('utf-8')
+            except UnicodeDecodeError:
+                url_conf['file'] = self.save_file(body)
+        if payload is not None:
+            url_conf['payload'] = payload
+        url = urlfunc.get_url(f'{self.http_prefix}{path}',
+                              payload if isinstance(payload, dict) else None)
+        line = json.dumps([f'{command} {url}', url_conf]) + '\n'
+        with self._lock:
+            self._jsf.write(line)
+            self._jsf.flush()
+            self.recorded += 1
+
+    def save_file(self, body):
+        """ save binary body in files directory, path relative to jsonl_file directory """
+        os.makedirs(self.files_dir, exist_ok=True)
+        name = hashlib.blake2b(body, digest_size=16).hexdigest()
+        path = os.path.join(self.files_dir, name)
+        if not os.path.exists(path):
+            with open(path, 'wb') as file:
+                file.write(body)
+        return os.path.join(os.path.basename(self.files_dir), name)
+
+    def close(self):
+        """ close recording file and pooled connections """
+        with self._lock:
+            self._jsf.close()
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
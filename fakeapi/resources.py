@@ -0,0 +1,149 @@
+"""
+stateful resource collections declared in url_config:
+"RESOURCE http://localhost/comments": {"id": "id", "indexes": ["name"], "page_size": 100,
+                                       "data": [{"id": 1, "name": "sample"}]}
+GET    /comments            list, ?offset=&limit= pagination, ?<field>=<value> filters
+POST   /comments            create item (id generated if missing)
+GET    /comments/<id>       get item
+PUT    /comments/<id>       replace item
+PATCH  /comments/<id>       update item fields
+DELETE /comments/<id>       delete item
+items are stored by id (O(1) access), filters on indexes fields use value -> ids indexes
+returned items are copies, PUT/PATCH update items in place (collection order is kept)
+filter values are compared to json of item values (?done=true, ?parent=null, ?count=1)
+"""
+
+import json
+import threading
+from copy import deepcopy
+from itertools import islice
+
+RESOURCE = 'RESOURCE'
+PAGE_PARAMS = ('offset', 'limit')
+
+def query_value(value):
+    """ item value as written in query string: strings as is, others as json """
+    return value if isinstance(value, str) else json.dumps(value)
+
+class Resource():
+    """ in-memory collection of json objects, thread-safe """
+
+    def __init__(self, url_conf, url_method=None):
+        self.conf = url_conf
+        self.url_method = url_method    # url_config key, metrics route label
+        self.id_field = url_conf.get('id', 'id')
+        self.page_size = url_conf.get('page_size')
+        self.items = {}     # str(id): item
+        self.indexes = {field: {} for field in url_conf.get('indexes', [])}  # value: {id: None}
+        self.next_id = 1
+        self.lock = threading.Lock()
+        for item in url_conf.get('data', []):
+            self._add(deepcopy(item))
+
+    def _add(self, item):
+        """ store item, generates id if missing """
+        item_id = item.get(self.id_field)
+        if item_id is None:
+            item_id = item[self.id_field] = self.next_id
+        if isinstance(item_id, int) and item_id >= self.next_id:
+            self.next_id = item_id + 1
+        key = str(item_id)
+        self.items[key] = item
+        self._index(key, item)
+        return key
+
+    def _index(self, key, item):
+        """ add item fields to indexes """
+        for field, index in self.indexes.items():
+            if field in item:
+                index.setdefault(query_value(item[field]), {})[key] = None
+
+    def _unindex(self, key, item):
+        """ remove item fields from indexes """
+        for field, index in self.indexes.items():
+            if field in item:
+                value = query_value(item[field])
+                ids = index.get(value)
+                ids.pop(key, None)
+                if not ids:
+                    del index[value]
+
+    def call(self, method, item_id, query, payload):
+        """
+        (status_code, data, headers) of method on collection (item_id None) or item
+        query: decoded (name, value) pairs
+        returned items are copies, stored items are only modified through calls
+        """
+        if item_id is None:
+            if method == 'get':
+                return self.list(query)
+            if method == 'post':
+                return self.create(payload)
+            return 405, {'error': f'{method.upper()} not allowed on collection'}, {}
+        with self.lock:
+            item = self.items.get(item_id)
+            if item is None:
+                return 404, {'error': f'{item_id} not found'}, {}
+            if method == 'get':
+                return 200, deepcopy(item), {}
+            if method == 'delete':
+                self._unindex(item_id, self.items.pop(item_id))
+                return 200, {}, {}
+            if not isinstance(payload, dict):
+                return 400, {'error': 'json object expected'}, {}
+            if method not in ('patch', 'put'):
+                return 405, {'error': f'{method.upper()} not allowed on item'}, {}
+            # item is updated in place: its position in collection is kept
+            self._unindex(item_id, item)
+            id_value = item[self.id_field]
+            if method == 'put':
+                item.clear()
+            item.update(deepcopy(payload))
+            item[self.id_field] = id_value
+            self._index(item_id, item)
+            return 200, deepcopy(item), {}
+
+    def create(self, payload):
+        """ add item, 409 if id exists """
+        if not isinstance(payload, dict):
+            return 400, {'error': 'json object expected'}, {}
+        with self.lock:
+            if payload.get(self.id_field) is not None and str(payload[self.id_field]) in self.items:
+                return 409, {'error': f'{payload[self.id_field]} exists'}, {}
+            item = deepcopy(payload)
+            self._add(item)
+            return 201, deepcopy(item), {}
+
+    def list(self, query):
+        """ filtered items page, X-Total-Count header """
+        filters = {}
+        offset, limit = 0, self.page_size
+        for name, value in query:
+            if name in PAGE_PARAMS:
+                try:
+                    value = max(0, int(value))
+                except ValueError:
+                    return 400, {'error': f'{name} must be an integer'}, {}
+                if name == 'offset':
+                    offset = value
+                else:
+                    limit = value
+            else:
+                filters[name] = value
+        with self.lock:
+            indexed = [self.indexes[name].get(value, {}) for name, value in filters.items()
+                       if name in self.indexes]
+            if indexed:
+                indexed.sort(key=len)
+                keys = [key for key in indexed[0] if all(key in ids for ids in indexed[1:])]
+                items = [self.items[key] for key in keys]
+            else:
+                items = self.items.values()
+            others = [(name, value) for name, value in filters.items() if name not in self.indexes]
+            if others:
+                items = [item for item in items
+                         if all(query_value(item.get(name)) == value for name, value in others)]
+            total = len(items)
+            end = None if limit is None else offset + limit
+            page = deepcopy(list(islice(items, offset, end)))
+        return 200, page, {'X-Total-Count': str(total)}
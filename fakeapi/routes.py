@@ -0,0 +1,465 @@
+""" url_config routes with cached serialized responses """
+# pylint: disable=R0903
+
+import os
+import re
+import sys
+import json
+import gzip
+import zlib
+import time
+import base64
+import random
+import hashlib
+import weakref
+import threading
+from collections import OrderedDict
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSORS = {
+    'gzip': lambda content: gzip.compress(content, compresslevel=6, mtime=0),
+    'deflate': zlib.compress,
+}
+if brotli is not None:
+    COMPRESSORS['br'] = brotli.compress
+
+SLICE_PARAMS = ('offset', 'limit', 'cursor')
+CHUNK_SIZE = 65536
+
+def compress(content, encoding):
+    """ content compressed with http content-coding (gzip/deflate/br) """
+    return COMPRESSORS[encoding](content)
+
+def json_chunks(data, chunk_size=CHUNK_SIZE):
+    """
+    utf-8 json of data by chunks of about chunk_size bytes
+    list items are serialized one by one, output is the same as json.dumps(data)
+    """
+    if not isinstance(data, list):
+        yield json.dumps(data).encode('utf-8')
+        return
+    parts, size, sep = ['['], 1, ''
+    for item in data:
+        part = sep + json.dumps(item)
+        sep = ', '
+        parts.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield ''.join(parts).encode('utf-8')
+            parts, size = [], 0
+    parts.append(']')
+    yield ''.join(parts).encode('utf-8')
+
+def encode_cursor(offset):
+    """ opaque cursor of list offset """
+    return base64.urlsafe_b64encode(f'offset:{offset}'.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """ list offset of cursor, ValueError if invalid """
+    try:
+        text = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError) as error:
+        raise ValueError(f'invalid cursor {cursor}') from error
+    name, _, offset = text.partition(':')
+    if name != 'offset' or not offset.isdigit():
+        raise ValueError(f'invalid cursor {cursor}')
+    return int(offset)
+
+def slice_items(items, query):
+    """
+    (page, headers) of items list sliced by query offset/limit/cursor params
+    headers: X-Total-Count, X-Next-Cursor if items remain, ValueError if invalid params
+    """
+    params = dict(query)
+    offset = decode_cursor(params['cursor']) if 'cursor' in params else int(params.get('offset', 0))
+    limit = int(params['limit']) if 'limit' in params else None
+    if offset < 0 or limit is not None and limit < 0:
+        raise ValueError('offset and limit must be positive')
+    end = len(items) if limit is None else min(len(items), offset + limit)
+    headers = {'X-Total-Count': str(len(items))}
+    if end < len(items):
+        headers['X-Next-Cursor'] = encode_cursor(end)
+    if offset == 0 and end == len(items):
+        return items, headers
+    return items[offset:end], headers
+
+class Route():
+    """
+    url_config entry 'METHOD url': {'status_code': ..., 'data': ...}
+    text/content of response are serialized once on first access
+    or {'file': 'path/to/body', 'content_type': ...} to respond with file content
+    'stream': true list data is serialized for each call by chunks (json_chunks)
+    """
+
+    __slots__ = ('url_method', 'conf', 'data', 'content_type', 'file', 'template', 'latency',
+                 'stream', 'last_modified', 'bodies', '_body')
+
+    def __init__(self, url_method, url_conf, base_dir=None, bodies=None):
+        """ bodies: BodyStore sharing identical serialized responses between routes """
+        self.url_method = url_method
+        self.conf = url_conf
+        self.data = url_conf.get('data', '')
+        self.content_type = url_conf.get('content_type')
+        self.file = url_conf.get('file')
+        if self.file and base_dir:
+            self.file = os.path.join(base_dir, self.file)
+        self.template = Template(self.data) if url_conf.get('template') else None
+        self.latency = Latency.from_conf(url_conf)
+        self.stream = bool(url_conf.get('stream'))
+        self.last_modified = time.time()
+        self.bodies = bodies
+        self._body = None
+
+    def is_current(self, url_conf):
+        """ route still matches url_conf (not replaced or data not replaced) """
+        return url_conf is self.conf and url_conf.get('data', '') is self.data
+
+    @property
+    def body(self):
+        """ serialized data Body, shared with routes having the same data """
+        if self._body is None:
+            text = self.data if isinstance(self.data, str) else json.dumps(self.data)
+            self._body = self.bodies.get(text) if self.bodies is not None else Body(text)
+        return self._body
+
+    @property
+    def text(self):
+        """ serialized data """
+        return self.body.text
+
+    @property
+    def content(self):
+        """ utf-8 encoded text """
+        return self.body.content
+
+    def validators(self):
+        """
+        (ETag, Last-Modified timestamp) of route response, (None, None) for templates/streams
+        data routes: hash of content (computed once), route creation time
+        file routes: file mtime and size
+        """
+        if self.template or self.stream:
+            return None, None
+        if self.file:
+            try:
+                stat = os.stat(self.file)
+            except OSError:
+                return None, None
+            return f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"', stat.st_mtime
+        return self.body.etag, self.last_modified
+
+    def encoded(self, encoding):
+        """ content compressed with encoding, compressed once """
+        return self.body.encoded(encoding)
+
+class Body():
+    """ serialized response text/content, ETag and compressed contents computed once """
+    __slots__ = ('text', 'content', '_etag', '_encoded', '__weakref__')
+
+    def __init__(self, text):
+        self.text = text
+        self.content = text.encode('utf-8')
+        self._etag = None
+        self._encoded = None
+
+    @property
+    def etag(self):
+        """ weak ETag of content hash """
+        if self._etag is None:
+            self._etag = f'W/"{hashlib.blake2b(self.content, digest_size=16).hexdigest()}"'
+        return self._etag
+
+    def encoded(self, encoding):
+        """ content compressed with encoding """
+        if self._encoded is None:
+            self._encoded = {}
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = compress(self.content, encoding)
+        return body
+
+class BodyStore():
+    """
+    Body by serialized text, routes with identical responses share one Body
+    bodies are dropped when no route uses them anymore
+    """
+
+    def __init__(self):
+        self._bodies = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        """ shared Body of text """
+        with self._lock:
+            body = self._bodies.get(text)
+            if body is None:
+                body = self._bodies[text] = Body(text)
+            return body
+
+    def values(self):
+        """ list of bodies """
+        with self._lock:
+            return list(self._bodies.values())
+
+    def __len__(self):
+        return len(self._bodies)
+
+class Latency():
+    """
+    simulated response latency: delay_ms before response, randomized by jitter_ms with
+    jitter distribution 'uniform' (delay_ms +/- jitter_ms), 'normal' (jitter_ms standard
+    deviation) or 'exponential' (delay_ms + exponential of jitter_ms mean),
+    bytes_per_s throttles body sending
+    """
+    KEYS = ('delay_ms', 'jitter_ms', 'jitter', 'bytes_per_s')
+    JITTERS = ('uniform', 'normal', 'exponential')
+
+    def __init__(self, delay_ms=0, jitter_ms=0, jitter='uniform', bytes_per_s=None):
+        if jitter not in self.JITTERS:
+            raise ValueError(f'jitter must be one of {self.JITTERS}')
+        self.delay_ms = delay_ms
+        self.jitter_ms = jitter_ms
+        self.jitter = jitter
+        self.bytes_per_s = bytes_per_s or None
+
+    @classmethod
+    def from_conf(cls, url_conf):
+        """ Latency of url_conf latency keys, None if none defined """
+        if not any(key in url_conf for key in cls.KEYS):
+            return None
+        return cls(**{key: url_conf[key] for key in cls.KEYS if key in url_conf})
+
+    def __bool__(self):
+        return bool(self.delay_ms or self.jitter_ms or self.bytes_per_s)
+
+    def delay(self):
+        """ random delay in seconds """
+        delay_ms = self.delay_ms
+        if self.jitter_ms:
+            if self.jitter == 'uniform':
+                delay_ms += random.uniform(-self.jitter_ms, self.jitter_ms)
+            elif self.jitter == 'normal':
+                delay_ms = random.gauss(delay_ms, self.jitter_ms)
+            else:
+                delay_ms += random.expovariate(1 / self.jitter_ms)
+        return max(delay_ms, 0) / 1000
+
+class Template():
+    """
+    response data with {{placeholders}} rendered for each call
+    placeholders: path.<name> (url template captures), query.<name>, payload.<field>[.<field>...],
+    now (iso utc time), timestamp (epoch seconds)
+    data is serialized once and split in text parts and placeholders:
+    "{{name}}" json strings are replaced by json value, {{name}} in strings by its string value
+    """
+    placeholder = re.compile(r'"\{\{\s*([\w.-]+)\s*\}\}"|\{\{\s*([\w.-]+)\s*\}\}')
+
+    def __init__(self, data):
+        self.is_json = not isinstance(data, str)
+        text = json.dumps(data) if self.is_json else data
+        self.parts = []
+        start = 0
+        for match in self.placeholder.finditer(text):
+            self.parts.append(text[start:match.start()])
+            value_name, inline_name = match.groups()
+            if value_name and self.is_json:
+                self.parts.append((tuple(value_name.split('.')), True))
+            else:
+                self.parts.append((tuple((inline_name or value_name).split('.')), False))
+            start = match.end()
+        self.parts.append(text[start:])
+
+    def render(self, context):
+        """ text with placeholders values from context dict """
+        out = []
+        for part in self.parts:
+            if part.__class__ is str:
+                out.append(part)
+                continue
+            path, as_json = part
+            value = self.resolve(context, path)
+            if as_json:
+                out.append(json.dumps(value))
+            elif value is not None:
+                value = value if isinstance(value, str) else json.dumps(value)
+                out.append(json.dumps(value)[1:-1] if self.is_json else value)
+        return ''.join(out)
+
+    @staticmethod
+    def resolve(context, path):
+        """ value of dotted path in context, None if missing """
+        value = context
+        for name in path:
+            if isinstance(value, dict):
+                value = value.get(name)
+            elif isinstance(value, list) and name.isdigit() and int(name) < len(value):
+                value = value[int(name)]
+            else:
+                return None
+        return value
+
+class LRUCache():
+    """ dict-like get/set cache keeping maxsize most recently used items """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """ cached item, marked as most recently used """
+        with self._lock:
+            value = self._items.get(key, default)
+            if key in self._items:
+                self._items.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        """ cache item, evicts least recently used """
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+class UrlConfig(dict):
+    """ url_config dict counting its modifications (version), to reindex changed url_config """
+    version = 0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.version += 1
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def pop(self, *args):
+        self.version += 1
+        return super().pop(*args)
+
+    def popitem(self):
+        self.version += 1
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self.version += 1
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self.version += 1
+        super().update(*args, **kwargs)
+
+    def clear(self):
+        self.version += 1
+        super().clear()
+
+class TrieNode():
+    """ url template path segment """
+    __slots__ = ('literals', 'params', 'star', 'rest', 'routes')
+
+    def __init__(self):
+        self.literals = {}  # segment: TrieNode
+        self.params = []    # (name, regex, TrieNode)
+        self.star = None    # '*' TrieNode
+        self.rest = None    # '**' TrieNode
+        self.routes = {}    # sorted query params: url_method
+
+class RouteTrie():
+    """
+    url templates routes matched segment by segment:
+      {name}        any non empty segment, captured as name
+      {name:regex}  non empty segment matching regex, captured as name
+      *             any segment
+      **            any remaining segments (last segment)
+    literal segments have priority over {name:regex}, then {name}, then *, then **
+    query params of template must be the same as called url ones,
+    template without query params matches any query params
+    """
+
+    def __init__(self):
+        self.root = TrieNode()
+        self.size = 0
+
+    @staticmethod
+    def is_template(segments):
+        """ url path segments contain template """
+        return any(seg in ('*', '**') or seg[:1] == '{' and seg[-1:] == '}' for seg in segments)
+
+    def insert(self, method, origin, segments, query, url_method):
+        """ add url template route """
+        node = self.root
+        for literal in (method, origin):
+            node = node.literals.setdefault(sys.intern(literal), TrieNode())
+        for seg in segments:
+            if seg == '*':
+                node.star = node = node.star or TrieNode()
+            elif seg == '**':
+                node.rest = node = node.rest or TrieNode()
+                break
+            elif seg[:1] == '{' and seg[-1:] == '}':
+                name, _, regex = seg[1:-1].partition(':')
+                for param_name, param_regex, child in node.params:
+                    if param_name == name and (param_regex and param_regex.pattern) == regex:
+                        node = child
+                        break
+                else:
+                    child = TrieNode()
+                    param = (name, re.compile(regex) if regex else None, child)
+                    if regex:    # tried before {name} params
+                        node.params.insert(sum(1 for _, other, _ in node.params if other), param)
+                    else:
+                        node.params.append(param)
+                    node = child
+            else:
+                node = node.literals.setdefault(sys.intern(seg), TrieNode())
+        node.routes.setdefault(query, url_method)
+        self.size += 1
+
+    def match(self, method, origin, segments, query):
+        """ (url_method, captures) of matching template, or (None, None) """
+        node = self.root.literals.get(method)
+        node = node and node.literals.get(origin)
+        if node is None:
+            return None, None
+        captures = {}
+        url_method = self._match(node, segments, 0, query, captures)
+        return (url_method, captures) if url_method else (None, None)
+
+    def _match(self, node, segments, index, query, captures):
+        """ depth first match of segments[index:] """
+        if index == len(segments):
+            return self._leaf(node, query) or (node.rest and self._leaf(node.rest, query))
+        seg = segments[index]
+        child = node.literals.get(seg)
+        if child:
+            url_method = self._match(child, segments, index + 1, query, captures)
+            if url_method:
+                return url_method
+        for name, regex, child in node.params if seg else ():
+            if regex is None or regex.fullmatch(seg):
+                captures[name] = seg
+                url_method = self._match(child, segments, index + 1, query, captures)
+                if url_method:
+                    return url_method
+                del captures[name]
+        if node.star:
+            url_method = self._match(node.star, segments, index + 1, query, captures)
+            if url_method:
+                return url_method
+        return node.rest and self._leaf(node.rest, query)
+
+    @staticmethod
+    def _leaf(node, query):
+        """ route for query, or route without query """
+        return node.routes.get(query) or node.routes.get(())
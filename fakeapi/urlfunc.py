@@ -1,6 +1,29 @@
 """ url generation functions """
-from urllib.parse import urlencode, urlparse, unquote_plus #, parse_qs, quote
-from requests.utils import requote_uri
+import re
+from collections.abc import Mapping
+from urllib.parse import urlencode, urlparse, unquote_plus, unquote, parse_qsl, quote
+
+ENCODED_SLASH = re.compile('%2f', re.IGNORECASE)
+UNRESERVED = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+
+def requote_uri(uri):
+    """
+    uri with unsafe characters quoted and escaped unreserved characters unquoted,
+    as requests.utils.requote_uri (requests is not imported by server)
+    """
+    parts = uri.split('%')
+    for i in range(1, len(parts)):
+        code = parts[i][:2]
+        if len(code) == 2 and code.isalnum():
+            try:
+                char = chr(int(code, 16))
+            except ValueError:    # invalid escape: all '%' are quoted
+                return quote(uri, safe="!#$&'()*+,/:;=?@[]~")
+            if char in UNRESERVED:
+                parts[i] = char + parts[i][2:]
+                continue
+        parts[i] = '%' + parts[i]
+    return quote(''.join(parts), safe="!#$%&'()*+,/:;=?@[]~")
 
 def get_url(url, params):
     """
@@ -20,3 +43,58 @@ def get_url2(url, params):
     query = unquote_plus(urlencode(params))
     urlp = urlp._replace(query='&'.join([urlp.query, query]).strip('&'))
     return urlp.geturl()
+
+def query_items(params):
+    """
+    decoded (key, value) pairs of params as urlencode would send them
+    params that urlencode cannot handle (str, nested lists...) are ignored
+    """
+    if not params:
+        return []
+    items = params.items() if isinstance(params, Mapping) else params
+    try:
+        return [(_decode(k), _decode(v)) for k, v in items]
+    except (TypeError, ValueError):
+        return []
+
+def _decode(value):
+    """ str value as decoded from query string """
+    return value.decode('utf-8') if isinstance(value, bytes) else str(value)
+
+def url_key(method, url, params=None):
+    """
+    canonical route key: (METHOD, unquoted url without query, sorted query params)
+    get_url and get_url2 forms of the same url have the same key
+    """
+    urlp = urlparse(url)
+    query = parse_qsl(urlp.query, keep_blank_values=True) + query_items(params)
+    # %2F stays encoded: p%2Fq is one path segment, not p/q
+    base = '%2F'.join(unquote(part) for part in
+                      ENCODED_SLASH.split(urlp._replace(query='', fragment='').geturl()))
+    return (method.upper(), base, tuple(sorted(query)))
+
+def config_keys(method, url):
+    """
+    canonical keys of url_config url, '+' in query is a space (get_url form)
+    and a literal '+' (get_url2 form: 'q=a+b' for params {'q': 'a+b'})
+    """
+    key = url_key(method, url)
+    urlp = urlparse(url)
+    if '+' not in urlp.query:
+        return (key,)
+    return (key, url_key(method, urlp._replace(query=urlp.query.replace('+', '%2B')).geturl()))
+
+def url_key_data(key, data):
+    """ add data params to canonical url_key """
+    items = query_items(data)
+    if not items:
+        return key
+    return (key[0], key[1], tuple(sorted(key[2] + tuple(items))))
+
+def split_url(url):
+    """ (scheme://netloc, path segments) of url without query """
+    start = url.find('://')
+    start = url.find('/', start + 3 if start >= 0 else 0)
+    if start < 0:
+        return url, ()
+    return url[:start], tuple(url[start + 1:].split('/'))
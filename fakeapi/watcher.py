@@ -0,0 +1,153 @@
+"""
+url_config json file watcher for hot reload (--watch)
+inotify events on file directory on linux (editors replace files by rename),
+stat polling of file mtime/size elsewhere
+"""
+
+import os
+import json
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import weakref
+import threading
+from collections.abc import Mapping
+from .lazyconfig import LazyUrlConfig
+from .fakelog import logger
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+_EVENT = struct.Struct('iIII')
+
+_watchers = weakref.WeakSet()
+
+def _inotify():
+    """ libc with inotify functions or None """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        return libc if hasattr(libc, 'inotify_init1') else None
+    except OSError:
+        return None
+
+class ConfigWatcher():
+    """
+    reload url_config of FakeAPI when json file changes
+    only changed routes are reindexed (FakeAPI.update_config),
+    invalid json or routes are reported and previous url_config is kept
+    '.jsonl' files are reloaded as LazyUrlConfig
+    """
+
+    def __init__(self, fakeapi, url_json, interval=0.5, use_inotify=True):
+        self.fakeapi = fakeapi
+        self.url_json = os.path.abspath(url_json)
+        self.interval = interval
+        self.libc = _inotify() if use_inotify else None
+        self.reloads = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._stat = self.file_stat()
+
+    def file_stat(self):
+        """ (mtime_ns, size) of file, None if missing """
+        try:
+            stat = os.stat(self.url_json)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self):
+        """ start watcher thread """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='fakeapi-watch', daemon=True)
+        self._thread.start()
+        _watchers.add(self)
+        return self
+
+    def stop(self):
+        """ stop watcher thread """
+        self._stop.set()
+        _watchers.discard(self)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def run(self):
+        """ wait for changes, inotify or polling """
+        fd = self._inotify_fd()
+        try:
+            while not self._stop.is_set():
+                if fd is None:
+                    self._stop.wait(self.interval)
+                elif not self._wait_event(fd):
+                    continue
+                stat = self.file_stat()
+                if stat is not None and stat != self._stat:
+                    self._stat = stat
+                    self.reload()
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def _inotify_fd(self):
+        """ inotify fd watching file directory, None to poll """
+        if self.libc is None:
+            return None
+        fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if self.libc.inotify_add_watch(fd, os.path.dirname(self.url_json).encode(), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def _wait_event(self, fd):
+        """ True if an event on watched file was read before interval """
+        if not select.select([fd], [], [], self.interval)[0]:
+            return False
+        name = os.path.basename(self.url_json).encode()
+        found = False
+        try:
+            buf = os.read(fd, 65536)
+        except BlockingIOError:
+            return False
+        pos = 0
+        while pos < len(buf):
+            _, _, _, length = _EVENT.unpack_from(buf, pos)
+            pos += _EVENT.size
+            found = found or buf[pos:pos + length].rstrip(b'\0') == name
+            pos += length
+        return found
+
+    def reload(self):
+        """ load json file and update FakeAPI url_config, returns diff or None """
+        start = time.perf_counter()
+        try:
+            if self.url_json.endswith('.jsonl'):
+                url_config = LazyUrlConfig(self.url_json)
+            else:
+                with open(self.url_json, 'r', encoding='utf-8') as jsf:
+                    url_config = json.load(jsf)
+            if not isinstance(url_config, Mapping):
+                raise ValueError('url_config must be a json object')
+            diff = self.fakeapi.update_config(url_config)
+        except Exception as exc:    # pylint: disable=W0703 (watcher thread must survive)
+            logger.warning('reload %s failed, keeping previous routes: %s', self.url_json, exc)
+            return None
+        self.reloads += 1
+        logger.info('reloaded %s in %.1f ms: %d added, %d removed, %d changed', self.url_json,
+                    (time.perf_counter() - start) * 1000,
+                    len(diff['added']), len(diff['removed']), len(diff['changed']))
+        return diff
+
+def _restart_watchers():
+    """ watcher threads do not survive fork, each worker reloads its own url_config """
+    for watcher in list(_watchers):
+        watcher.start()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_watchers)
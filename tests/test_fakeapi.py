@@ -2,15 +2,46 @@
 """ test """
 import os
 import sys
+import time
+import signal
+import socket
+import subprocess
+import tempfile
 import unittest
 import warnings
 import json
+import asyncio
+import threading
+import contextlib
+import http.client
+from unittest import mock
 from io import BytesIO as IO
 import requests
 from apiclient import APIClient
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from fakeapi import (FakeAPI, FakeResponse, FakeAPIServer, FakeAPIHTTPHandler,
-                     UrlConfigHelper, get_url, get_url2)
+from fakeapi.fakelog import setup_logging, stop_logging
+from fakeapi import bench
+from fakeapi.fakeserver import accepted_encoding
+from fakeapi.watcher import ConfigWatcher
+from fakeapi.metrics import Metrics
+from fakeapi.recorder import RecordingProxy
+from fakeapi.routes import json_chunks
+from fakeapi import (FakeAPI, AsyncFakeAPI, FakeResponse, FakeAPIServer, FakeAPIHTTPHandler,
+                     UrlConfigHelper, LazyUrlConfig, write_jsonl, get_url, get_url2)
+
+
+@contextlib.contextmanager
+def serving(server):
+    """ server serving in a thread, shut down and closed at the end of with block """
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join(5)
+
 
 url_config = {
     'GET http://localhost/api': {
@@ -111,6 +142,7 @@ class UnitTest(unittest.TestCase):
             "data": url_conf['data'],
             "status_code": 200,
             "payload": None,
+            "count": 1,
         })
         self.assertEqual(len(self.api.responses), 1)
         self.assertEqual(self.api.responses[0].url, response.url)
@@ -193,6 +225,168 @@ class UnitTest(unittest.TestCase):
         self.assertEqual(server.server_port, 8080)
 
 
+class TestUrlIndex(unittest.TestCase):
+    """ canonical url index """
+
+    def test1_query_order(self):
+        """ query params order and encoding does not matter """
+        api = FakeAPI({'GET http://localhost/api?b=2&a=foo bar': {'data': 'ok'}})
+        self.assertEqual(api.get('http://localhost/api?a=foo+bar&b=2').text, 'ok')
+        self.assertEqual(api.get('http://localhost/api', {'b': 2, 'a': 'foo bar'}).text, 'ok')
+        self.assertEqual(api.get('http://localhost/api?a=foo%20bar', {'b': 2}).text, 'ok')
+        self.assertEqual(api.get('http://localhost/api?a=foo').status_code, 404)
+
+    def test2_data_precedence(self):
+        """ url with data params is preferred to url without """
+        api = FakeAPI({
+            'POST http://localhost/api': {'data': 'nodata'},
+            'POST http://localhost/api?name=foo/bar': {'data': 'data'},
+        })
+        self.assertEqual(api.post('http://localhost/api', {'name': 'foo/bar'}).text, 'data')
+        self.assertEqual(api.post('http://localhost/api', {'name': 'foo'}).text, 'nodata')
+        self.assertEqual(api.post('http://localhost/api', [{'name': 'foo'}]).text, 'nodata')
+
+    def test3_reindex(self):
+        """ index follows url_config changes """
+        api = FakeAPI({'GET http://localhost/api': {'data': 'ok'}})
+        api.url_config['GET http://localhost/new'] = {'data': 'new'}
+        self.assertEqual(api.get('http://localhost/new').text, 'new')
+        del api.url_config['GET http://localhost/api']
+        self.assertEqual(api.get('http://localhost/api').status_code, 404)
+        api.url_config = {'GET http://localhost/other': {'data': 'other'}}
+        self.assertEqual(api.get('http://localhost/other').text, 'other')
+        del api.url_config['GET http://localhost/other']
+        api.url_config['GET http://localhost/api?q=1'] = {'data': 'same size'}
+        self.assertEqual(api.get('http://localhost/api', {'q': 1}).text, 'same size')
+        self.assertEqual(api.get('http://localhost/other').status_code, 404)
+        api.url_config.update({'GET http://localhost/api?q=2': api.url_config.pop(
+            'GET http://localhost/api?q=1')})
+        self.assertEqual(api.get('http://localhost/api', {'q': 2}).text, 'same size')
+        self.assertEqual(api.get('http://localhost/api', {'q': 1}).status_code, 404)
+
+    def test4_plus_in_query(self):
+        """ '+' of url_config key query matches space (get_url) and '+' (get_url2) params """
+        api = FakeAPI({'GET http://localhost/api?q=a+b': {'data': 'ok'},
+                       'GET http://localhost/tz?tz=+02:00': {'data': 'tz'}})
+        self.assertEqual(api.get('http://localhost/api', {'q': 'a+b'}).text, 'ok')
+        self.assertEqual(api.get('http://localhost/api', {'q': 'a b'}).text, 'ok')
+        self.assertEqual(api.get('http://localhost/api?q=a%2Bb').text, 'ok')
+        self.assertEqual(api.get('http://localhost/tz', {'tz': '+02:00'}).text, 'tz')
+        self.assertEqual(api.get('http://localhost/api', {'q': 'a-b'}).status_code, 404)
+
+    def test5_distinct_keys(self):
+        """ encoded slash and blank params keys are not merged, verbatim key preferred """
+        for order in (1, -1):
+            api = FakeAPI(dict(list({
+                'GET http://localhost/p%2Fq': {'data': 'encoded'},
+                'GET http://localhost/p/q': {'data': 'path'},
+                'GET http://localhost/api?a=': {'data': 'blank'},
+                'GET http://localhost/api?a': {'data': 'no value'},
+            }.items())[::order]))
+            self.assertEqual(api.get('http://localhost/p/q').text, 'path')
+            self.assertEqual(api.get('http://localhost/p%2Fq').text, 'encoded')
+            self.assertEqual(api.get('http://localhost/api?a').text, 'no value')
+            self.assertEqual(api.get('http://localhost/api', {'a': ''}).text, 'blank')
+
+
+class TestUrlTemplates(unittest.TestCase):
+    """ url templates routes """
+    api = FakeAPI({
+        'GET http://localhost/api/users/{id}': {'data': 'user'},
+        'GET http://localhost/api/users/me': {'data': 'me'},
+        'GET http://localhost/api/users/{id}/groups/{group:[0-9]+}': {'data': 'group'},
+        'GET http://localhost/api/users/{id}/groups/{name}': {'data': 'group name'},
+        'GET http://localhost/api/items/*/detail?full=1': {'data': 'detail'},
+        'GET http://localhost/static/**': {'data': 'static'},
+        'POST http://localhost/api/users/{id}?name=foo': {'data': 'foo'},
+    })
+
+    def test1_templates(self):
+        """ templates match, exact urls first """
+        response = self.api.get('http://localhost/api/users/12')
+        self.assertEqual(response.text, 'user')
+        self.assertEqual(response.path_params, {'id': '12'})
+        self.assertEqual(self.api.get('http://localhost/api/users/me').text, 'me')
+        response = self.api.get('http://localhost/api/users/1/groups/42')
+        self.assertEqual(response.text, 'group')
+        self.assertEqual(response.path_params, {'id': '1', 'group': '42'})
+        response = self.api.get('http://localhost/api/users/1/groups/admins')
+        self.assertEqual(response.path_params, {'id': '1', 'name': 'admins'})
+        self.assertEqual(self.api.get('http://localhost/api/items/3/detail?full=1').text,
+                         'detail')
+        self.assertEqual(self.api.get('http://localhost/api/items/3/detail').status_code, 404)
+        self.assertEqual(self.api.get('http://localhost/static/css/main.css').text, 'static')
+        self.assertEqual(self.api.post('http://localhost/api/users/3', {'name': 'foo'}).text,
+                         'foo')
+        self.assertEqual(self.api.get('http://localhost/api/users').status_code, 404)
+        self.assertEqual(self.api.get('http://localhost/api/users/1/2/3').status_code, 404)
+
+    def test2_params_priority(self):
+        """ regex params before {name} whatever url_config order, no empty segment param """
+        api = FakeAPI({
+            'GET http://localhost/groups/{name}': {'data': 'name'},
+            'GET http://localhost/groups/{group:[0-9]+}': {'data': 'group'},
+            'GET http://localhost/groups/{code:[a-z]{2}}': {'data': 'code'},
+        })
+        self.assertEqual(api.get('http://localhost/groups/42').text, 'group')
+        self.assertEqual(api.get('http://localhost/groups/fr').text, 'code')
+        self.assertEqual(api.get('http://localhost/groups/admins').text, 'name')
+        self.assertEqual(api.get('http://localhost/groups/').status_code, 404)
+        self.assertEqual(self.api.get('http://localhost/api/users/').status_code, 404)
+
+
+class TestTemplates(unittest.TestCase):
+    """ response data templates """
+    api = FakeAPI({
+        'GET http://localhost/api/users/{id}': {'template': True, 'data': {
+            'id': '{{path.id}}', 'message': 'user {{path.id}} "{{query.fields}}"',
+            'tags': ['{{query.tag}}']}},
+        'POST http://localhost/api/users': {'template': True, 'data': {
+            'created': '{{payload}}', 'name': '{{payload.name}}', 'age': '{{payload.age}}',
+            'first': '{{payload.groups.0}}', 'missing': '{{payload.none}}'}},
+        'GET http://localhost/api/text/{name}': {'template': True, 'data': 'hello {{path.name}}'},
+    })
+
+    def test1_render(self):
+        """ placeholders from path, query, payload """
+        response = self.api.get('http://localhost/api/users/12?fields=name', {'tag': 'a'})
+        self.assertEqual(response.json(), {'id': '12', 'message': 'user 12 "name"',
+                                           'tags': ['a']})
+        payload = {'name': 'foo "bar"', 'age': 42, 'groups': ['admin']}
+        response = self.api.post('http://localhost/api/users', payload)
+        self.assertEqual(response.json(), {'created': payload, 'name': 'foo "bar"', 'age': 42,
+                                           'first': 'admin', 'missing': None})
+        self.assertEqual(self.api.get('http://localhost/api/text/world').text, 'hello world')
+
+
+class TestRouteCache(unittest.TestCase):
+    """ serialized responses cache """
+
+    def test1_cache(self):
+        """ text/content serialized once per route """
+        api = FakeAPI({'GET http://localhost/api': {'data': {'message': 'ok'}}})
+        response1 = api.get('http://localhost/api')
+        response2 = api.get('http://localhost/api')
+        self.assertIs(response1.content, response2.content)
+        self.assertEqual(response1.json(), {'message': 'ok'})
+        response1.json()['message'] = 'modified'
+        self.assertEqual(response1.json(), {'message': 'ok'})
+        self.assertEqual(api.url_config['GET http://localhost/api']['data'], {'message': 'ok'})
+        self.assertEqual(api.get('http://localhost/api').text, '{"message": "ok"}')
+
+    def test2_invalidate(self):
+        """ cache follows url_config modifications """
+        api = FakeAPI({'GET http://localhost/api': {'data': {'message': 'ok'}}})
+        api.get('http://localhost/api')
+        api.url_config['GET http://localhost/api']['data'] = {'message': 'changed'}
+        self.assertEqual(api.get('http://localhost/api').text, '{"message": "changed"}')
+        api.url_config['GET http://localhost/api'] = {'data': 'replaced'}
+        self.assertEqual(api.get('http://localhost/api').text, 'replaced')
+        api.url_config['GET http://localhost/api']['data'] = {'message': 'inplace'}
+        api.reindex()
+        self.assertEqual(api.get('http://localhost/api').json(), {'message': 'inplace'})
+
+
 class MyClient(APIClient):
     """ client api """
 
@@ -264,6 +458,1053 @@ class TestCallAPI(unittest.TestCase):
         print(data)
 
 
+class TestLazyUrlConfig(unittest.TestCase):
+    """ json lines url_config """
+
+    def test1_lazy(self):
+        """ routes loaded on first call, bounded cache """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            jsonl = os.path.join(tmpdir, 'url_config.jsonl')
+            write_jsonl(dict(url_config, **{
+                f'GET http://localhost/items/{i}': {'data': {'id': i, 'name': 'a"b,\\n'}}
+                for i in range(10)}), jsonl)
+            api = FakeAPI(url_json=jsonl)
+            self.assertIsInstance(api.url_config, LazyUrlConfig)
+            self.assertEqual(len(api.url_config), len(url_config) + 10)
+            self.assertEqual(api.get('http://localhost/api').json(),
+                             {'message': 'Call successfull'})
+            self.assertEqual(api.post('http://localhost/api', {'name': 'foo bar'}).status_code, 201)
+            for i in range(10):
+                self.assertEqual(api.get(f'http://localhost/items/{i}').json()['id'], i)
+            self.assertLessEqual(len(api.routes), api.url_config.cache_size)
+            api = FakeAPI(LazyUrlConfig(jsonl, cache_size=2))
+            for i in range(10):
+                self.assertEqual(api.get(f'http://localhost/items/{i}').json()['id'], i)
+            self.assertEqual(len(api.routes), 2)
+            api.url_config.close()
+
+
+class TestFileRoutes(unittest.TestCase):
+    """ routes responding with file content """
+
+    def test1_file(self):
+        """ file content read on access, served with sendfile """
+        blob = bytes(range(256)) * 4096
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, 'blob.bin'), 'wb') as body:
+                body.write(blob)
+            with open(os.path.join(tmpdir, 'body.json'), 'w', encoding='utf-8') as body:
+                json.dump({'message': 'from file'}, body)
+            jsonfile = os.path.join(tmpdir, 'url_config.json')
+            with open(jsonfile, 'w', encoding='utf-8') as jsf:
+                json.dump({
+                    'GET http://localhost/blob': {
+                        'file': 'blob.bin', 'content_type': 'application/octet-stream'},
+                    'GET http://localhost/json': {'file': 'body.json'},
+                    'GET http://localhost/missing': {'file': 'missing.json'},
+                }, jsf)
+            api = FakeAPI(url_json=jsonfile)
+            response = api.get('http://localhost/json')
+            self.assertEqual(response.json(), {'message': 'from file'})
+            self.assertEqual(api.get('http://localhost/blob').content, blob)
+            for engine in ['threading', 'asyncio']:
+                server = api.http_server(port=0, http_prefix='http://localhost', start=False,
+                                         engine=engine)
+                url = f'http://localhost:{server.server_port}'
+                with serving(server):
+                    response = requests.get(f'{url}/blob', timeout=5)
+                    self.assertEqual(response.content, blob)
+                    self.assertEqual(response.headers['Content-type'],
+                                     'application/octet-stream')
+                    self.assertEqual(requests.get(f'{url}/json', timeout=5).json(),
+                                     {'message': 'from file'})
+                    self.assertEqual(requests.get(f'{url}/missing', timeout=5).status_code, 404)
+                    response = requests.head(f'{url}/blob', timeout=5)
+                    self.assertEqual(int(response.headers['Content-Length']), len(blob))
+
+
+class TestHistory(unittest.TestCase):
+    """ calls history modes """
+    url_config = {'GET http://localhost/api': {'data': {'message': 'ok'}}}
+
+    def call(self, api, count=5):
+        """ calls api """
+        for i in range(count):
+            api.get('http://localhost/api')
+            api.get(f'http://localhost/none/{i}')
+
+    def test1_ring(self):
+        """ keep last calls """
+        api = FakeAPI(self.url_config, history='ring', history_size=3)
+        self.call(api)
+        self.assertEqual(len(api.url_history), 3)
+        self.assertEqual(len(api.responses), 3)
+        self.assertEqual(api.url_history[-1], 'GET http://localhost/none/4')
+        self.assertEqual(api.url_calls['GET http://localhost/api']['count'], 5)
+
+    def test2_counters(self):
+        """ only counters """
+        api = FakeAPI(self.url_config, history='counters')
+        self.call(api)
+        self.assertEqual(len(api.url_history) + len(api.responses), 0)
+        self.assertEqual(api.url_calls['GET http://localhost/api'],
+                         {'count': 5, 'status_code': 200})
+        self.assertEqual(api.url_calls[''], {'count': 5, 'status_code': 404})
+        self.assertEqual(len(api.url_calls), 2)
+
+    def test3_off(self):
+        """ no history """
+        api = FakeAPI(self.url_config, history='off')
+        self.call(api)
+        self.assertEqual(api.url_calls, {})
+        self.assertRaises(ValueError, FakeAPI, history='none')
+
+
+class TestServerEngines(unittest.TestCase):
+    """ http server engines """
+    fakeapi = FakeAPI({
+        'GET http://localhost/api': {'data': {'message': 'Call successfull'}},
+        'POST http://localhost/api?name=foo': {'data': {'message': 'created'}},
+        'PATCH http://localhost/api?name=bar': {'data': {'message': 'updated'}},
+        'GET http://localhost/api/bad': {'data': 'bad', 'delay_ms': 1, 'jitter': 'gaussian'},
+    })
+
+    def run_engine(self, engine):
+        """ start engine in thread, call it """
+        server = self.fakeapi.http_server(port=0, http_prefix='http://localhost', start=False,
+                                          engine=engine)
+        url = f'http://localhost:{server.server_port}/api'
+        with serving(server):
+            response = requests.get(url, timeout=5)
+            self.assertEqual(response.json(), {'message': 'Call successfull'})
+            response = requests.post(url, json={'name': 'foo'}, timeout=5)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json(), {'message': 'created'})
+            self.assertEqual(requests.get(f'{url}/none', timeout=5).status_code, 404)
+            response = requests.patch(url, json={'name': 'bar'}, timeout=5)
+            self.assertEqual(response.json(), {'message': 'updated'})
+            self.assertEqual(requests.post(url, data='not json', timeout=5).status_code, 400)
+            self.assertEqual(requests.request('PROPFIND', url, timeout=5).status_code, 501)
+            with self.assertLogs('fakeapi', 'ERROR'):
+                self.assertEqual(requests.get(f'{url}/bad', timeout=5).status_code, 500)
+            if engine != 'http':
+                self.check_keep_alive(server.server_port)
+            else:
+                self.check_connection_close(server.server_port)
+
+    def check_keep_alive(self, port):
+        """ several requests on same HTTP/1.1 connection """
+        conn = http.client.HTTPConnection('localhost', port, timeout=5)
+        conn.request('GET', '/api')
+        response = conn.getresponse()
+        body = response.read()
+        sock = conn.sock
+        self.assertEqual(response.version, 11)
+        self.assertEqual(int(response.getheader('Content-Length')), len(body))
+        conn.request('HEAD', '/api')
+        response = conn.getresponse()
+        self.assertEqual(int(response.getheader('Content-Length')), len(body))
+        self.assertEqual(response.read(), b'')
+        conn.request('OPTIONS', '/api')
+        response = conn.getresponse()
+        response.read()
+        self.assertEqual(response.status, 204)
+        self.assertIn('PATCH', response.getheader('Allow'))
+        conn.request('POST', '/api', body=b'{invalid')
+        response = conn.getresponse()
+        self.assertEqual((response.status, response.read()), (400, b''))
+        conn.request('GET', '/api')
+        self.assertEqual(conn.getresponse().read(), body)
+        self.assertIs(conn.sock, sock)
+        conn.close()
+
+    def check_connection_close(self, port):
+        """ every connection closed by http engine, other clients are served """
+        for method, body in (('OPTIONS', None), ('POST', b'{invalid')):
+            conn = http.client.HTTPConnection('localhost', port, timeout=5)
+            conn.request(method, '/api', body=body)
+            response = conn.getresponse()
+            response.read()
+            self.assertEqual(response.getheader('Connection'), 'close')
+            self.assertEqual(requests.get(f'http://localhost:{port}/api', timeout=5).status_code,
+                             200)
+            conn.close()
+
+    def test1_threading(self):
+        """ ThreadingHTTPServer engine """
+        self.run_engine('threading')
+
+    def test2_asyncio(self):
+        """ asyncio engine """
+        self.run_engine('asyncio')
+
+    def test3_http(self):
+        """ HTTPServer engine """
+        self.run_engine('http')
+
+
+class TestLogging(unittest.TestCase):
+    """ fakeapi logging """
+
+    def test1_access_log(self):
+        """ json lines access log """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            access_log = os.path.join(tmpdir, 'access.jsonl')
+            setup_logging(quiet=True, access_log=access_log)
+            server = FakeAPI({'GET http://localhost/api': {'data': 'ok'}}).http_server(
+                port=0, http_prefix='http://localhost', start=False, engine='asyncio')
+            url = f'http://localhost:{server.server_port}'
+            try:
+                with serving(server):
+                    self.assertEqual(requests.get(f'{url}/api', timeout=5).text, 'ok')
+                    self.assertEqual(requests.get(f'{url}/none', timeout=5).status_code, 404)
+            finally:
+                stop_logging()
+            with open(access_log, encoding='utf-8') as jsf:
+                logs = [json.loads(line) for line in jsf]
+        self.assertEqual(logs[0]['method'], 'GET')
+        self.assertEqual(logs[0]['path'], '/api')
+        self.assertEqual(logs[0]['status'], 200)
+        self.assertIn('duration_ms', logs[0])
+        self.assertIn(404, [log['status'] for log in logs])
+
+
+class TestServerProcess(unittest.TestCase):
+    """ python -m fakeapi process """
+
+    def run_server(self, *args):
+        """ start server, check calls, stop with SIGTERM """
+        with socket.socket() as sock:
+            sock.bind(('localhost', 0))
+            port = sock.getsockname()[1]
+        proc = subprocess.Popen([sys.executable, '-m', 'fakeapi', '-p', str(port),
+                                 '-P', 'http://localhost:8080', *args, 'tests/tests.json'],
+                                cwd=os.path.join(os.path.dirname(__file__), '..'),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            for _ in range(50):
+                try:
+                    response = requests.get(f'http://localhost:{port}/comments/1', timeout=5)
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+            self.assertEqual(response.json(), {"name": "sample", "time": "Wed"})
+            for _ in range(10):
+                self.assertTrue(requests.get(f'http://localhost:{port}/comments', timeout=5).ok)
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            stderr = proc.communicate(timeout=10)[1]
+        self.assertEqual(proc.returncode, 0)
+        if '--quiet' in args:
+            self.assertNotIn(b'Stopping http server', stderr)
+        else:
+            self.assertIn(b'fakeapi: Stopping http server', stderr)
+
+    def test1_graceful_stop(self):
+        """ single process """
+        self.run_server()
+
+    def test2_workers(self):
+        """ pre-forked workers """
+        self.run_server('--workers', '3')
+
+    def test3_quiet(self):
+        """ start/stop messages are logged, silenced by --quiet """
+        self.run_server('--quiet')
+
+
+class TestBench(unittest.TestCase):
+    """ fakeapi.bench """
+
+    def test1_bench(self):
+        """ small benchmark run """
+        results = bench.run([10], [100], 100, 50, 2, ['asyncio'], 'counters')
+        self.assertEqual(results[0]['routes'], 10)
+        self.assertGreater(results[0]['calls_per_s'], 0)
+        self.assertLessEqual(results[0]['asyncio']['p50_ms'], results[0]['asyncio']['p99_ms'])
+
+
+class TestCompression(unittest.TestCase):
+    """ compressed responses """
+
+    def test1_accepted_encoding(self):
+        """ Accept-Encoding negotiation """
+        self.assertEqual(accepted_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(accepted_encoding('deflate;q=0.9, gzip;q=0.5'), 'deflate')
+        self.assertEqual(accepted_encoding('gzip;q=0, identity'), None)
+        self.assertEqual(accepted_encoding(None), None)
+
+    def test2_compressed(self):
+        """ compressed once per route and encoding """
+        data = [{'id': i, 'name': f'item {i}'} for i in range(1000)]
+        api = FakeAPI({'GET http://localhost/items': {'data': data},
+                       'GET http://localhost/small': {'data': 'small'}})
+        api.precompress(['gzip'])
+        route = api.lookup((('GET', 'http://localhost/items', ()),))[0]
+        gzipped = route.encoded('gzip')
+        server = api.http_server(port=0, http_prefix='http://localhost', start=False,
+                                 engine='asyncio')
+        url = f'http://localhost:{server.server_port}'
+        with serving(server):
+            response = requests.get(f'{url}/items', headers={'Accept-Encoding': 'gzip'},
+                                    timeout=5)
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(int(response.headers['Content-Length']), len(gzipped))
+            self.assertEqual(response.json(), data)
+            self.assertIs(route.encoded('gzip'), gzipped)
+            response = requests.get(f'{url}/items', headers={'Accept-Encoding': 'deflate'},
+                                    timeout=5)
+            self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+            self.assertEqual(response.json(), data)
+            response = requests.get(f'{url}/items', headers={'Accept-Encoding': 'identity'},
+                                    timeout=5)
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertEqual(response.json(), data)
+            response = requests.get(f'{url}/small', timeout=5)
+            self.assertNotIn('Content-Encoding', response.headers)
+
+
+class TestConditional(unittest.TestCase):
+    """ ETag / Last-Modified conditional GET """
+    api = FakeAPI({'GET http://localhost/api': {'data': {'message': 'ok'}}})
+
+    def test1_in_process(self):
+        """ FakeAPI.get with conditional headers """
+        response = self.api.get('http://localhost/api')
+        etag = response.headers['ETag']
+        self.assertEqual(self.api.get('http://localhost/api').headers['ETag'], etag)
+        response = self.api.get('http://localhost/api', headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        response = self.api.get('http://localhost/api', headers={'If-None-Match': '"other"'})
+        self.assertEqual(response.status_code, 200)
+        response = self.api.get('http://localhost/api',
+                                headers={'If-None-Match': etag.removeprefix('W/')})
+        self.assertEqual(response.status_code, 304)    # weak comparison
+        response = self.api.get('http://localhost/api', headers={'If-None-Match': f'W{etag}'})
+        self.assertEqual(response.status_code, 200)
+        last_modified = response.headers['Last-Modified']
+        response = self.api.get('http://localhost/api',
+                                headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+        response = self.api.get('http://localhost/api',
+                                headers={'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'})
+        self.assertEqual(response.status_code, 200)
+
+    def test2_server(self):
+        """ 304 from http server """
+        server = self.api.http_server(port=0, http_prefix='http://localhost', start=False)
+        url = f'http://localhost:{server.server_port}/api'
+        with serving(server):
+            with requests.Session() as session:
+                etag = session.get(url, timeout=5).headers['ETag']
+                response = session.get(url, headers={'If-None-Match': etag}, timeout=5)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response.headers['ETag'], etag)
+                self.assertEqual(session.get(url, timeout=5).json(), {'message': 'ok'})
+
+
+class TestLatency(unittest.TestCase):
+    """ simulated delay, jitter and throttling """
+    api = FakeAPI({
+        'GET http://localhost/slow': {'data': 'slow', 'delay_ms': 200},
+        'GET http://localhost/jitter': {'data': 'jitter', 'delay_ms': 50, 'jitter_ms': 10},
+        'GET http://localhost/exp': {'data': 'exp', 'delay_ms': 50, 'jitter_ms': 10,
+                                     'jitter': 'exponential'},
+        'GET http://localhost/throttled': {'data': 'x' * 2000, 'bytes_per_s': 10000},
+        'GET http://localhost/fast': {'data': 'fast'},
+    }, latency={'delay_ms': 5})
+
+    def test1_in_process(self):
+        """ response delay, sleep only in sleep mode """
+        self.assertEqual(self.api.get('http://localhost/slow').delay, 0.2)
+        self.assertEqual(self.api.get('http://localhost/fast').delay, 0.005)
+        delays = [self.api.get('http://localhost/jitter').delay for _ in range(200)]
+        self.assertTrue(0.04 <= min(delays) < max(delays) <= 0.06)
+        delays = [self.api.get('http://localhost/exp').delay for _ in range(200)]
+        self.assertTrue(0.05 <= min(delays) < max(delays))
+        self.assertEqual(self.api.get('http://localhost/throttled').bytes_per_s, 10000)
+        api = FakeAPI({'GET http://localhost/api': {'data': 'ok', 'delay_ms': 100}}, sleep=True)
+        start = time.perf_counter()
+        self.assertEqual(api.get('http://localhost/api').text, 'ok')
+        self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+
+    def test2_server(self):
+        """ concurrent delayed responses on asyncio engine, throttled body """
+        server = self.api.http_server(port=0, http_prefix='http://localhost', start=False,
+                                      engine='asyncio')
+        url = f'http://localhost:{server.server_port}'
+        results = []
+
+        def call(path, headers=None):
+            results.append(requests.get(f'{url}{path}', headers=headers, timeout=10).text)
+
+        with serving(server):
+            start = time.perf_counter()
+            threads = [threading.Thread(target=call, args=('/slow',)) for _ in range(50)]
+            for call_thread in threads:
+                call_thread.start()
+            for call_thread in threads:
+                call_thread.join()
+            elapsed = time.perf_counter() - start
+            self.assertEqual(results, ['slow'] * 50)
+            self.assertGreaterEqual(elapsed, 0.2)
+            self.assertLess(elapsed, 5, 'delays are not waited concurrently')    # 10 s if serial
+            start = time.perf_counter()
+            call('/throttled', {'Accept-Encoding': 'identity'})
+            self.assertEqual(results[-1], 'x' * 2000)
+            self.assertGreaterEqual(time.perf_counter() - start, 0.18)
+
+    def test3_server_sleep_once(self):
+        """ server waits delay once with FakeAPI sleep mode """
+        api = FakeAPI({'GET http://localhost/slow': {'data': 'slow', 'delay_ms': 300}},
+                      sleep=True, returns='json')
+        for engine in ('threading', 'asyncio'):
+            server = api.http_server(port=0, http_prefix='http://localhost', start=False,
+                                     engine=engine)
+            with serving(server), mock.patch.object(api, 'fake_call') as fake_call:
+                start = time.perf_counter()
+                response = requests.get(f'http://localhost:{server.server_port}/slow', timeout=5)
+                self.assertEqual(response.text, 'slow')
+                self.assertGreaterEqual(time.perf_counter() - start, 0.3)
+                fake_call.assert_not_called()    # no FakeAPI sleep before engine wait
+
+    def test4_http_engine_warning(self):
+        """ latency of routes on http engine is warned (one request at a time) """
+        api = FakeAPI({'GET http://localhost/fast': {'data': 'fast'}})
+        api.http_server(port=0, start=False, engine='http').server_close()
+        api = FakeAPI({'GET http://localhost/fast': {'data': 'fast'},
+                       'GET http://localhost/slow': {'data': 'slow', 'delay_ms': 200}})
+        with self.assertLogs('fakeapi', 'WARNING') as logs:
+            api.http_server(port=0, start=False, engine='http').server_close()
+        self.assertIn('use asyncio engine', logs.output[0])
+
+
+class TestMetrics(unittest.TestCase):
+    """ /_fakeapi/metrics endpoint """
+
+    def test1_metrics(self):
+        """ prometheus and json metrics of threading and asyncio engines """
+        api = FakeAPI({'GET http://localhost/api': {'data': {'message': 'ok'}},
+                       'POST http://localhost/api': {'status_code': 400}})
+        for engine in ('threading', 'asyncio'):
+            server = api.http_server(port=0, http_prefix='http://localhost', start=False,
+                                     engine=engine, metrics=True)
+            url = f'http://localhost:{server.server_port}'
+            with serving(server):
+                with requests.Session() as session:
+                    for _ in range(3):
+                        session.get(f'{url}/api', timeout=5)
+                    session.post(f'{url}/api', timeout=5)
+                    session.get(f'{url}/none', timeout=5)
+                    metrics = session.get(f'{url}/_fakeapi/metrics?format=json', timeout=5).json()
+                    text = session.get(f'{url}/_fakeapi/metrics', timeout=5).text
+                    self.assertEqual(session.patch(f'{url}/_fakeapi/routes',
+                                                   timeout=5).status_code, 404)
+            self.assertEqual(metrics['misses'], 1)
+            route = metrics['routes']['GET http://localhost/api']
+            self.assertEqual(route['hits'], 3)
+            self.assertEqual(route['status'], {'200': 3})
+            self.assertEqual(route['bytes'], 3 * len('{"message": "ok"}'))
+            self.assertEqual(sum(route['buckets']), 3)
+            self.assertEqual(metrics['routes']['POST http://localhost/api']['status'], {'400': 1})
+            self.assertIn('fakeapi_requests_total{route="GET http://localhost/api",status="200"} 3',
+                          text)
+            self.assertIn('fakeapi_misses_total 1', text)
+            self.assertIn('fakeapi_request_duration_seconds_bucket{route="GET http://localhost/api",'
+                          'status="200",le="+Inf"} 3', text)
+
+    def test2_threads(self):
+        """ per thread counters are summed """
+        metrics = Metrics()
+        threads = [threading.Thread(target=lambda: [metrics.observe('GET /', 200, 10, 0.002)
+                                                    for _ in range(1000)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(metrics.collect()[('GET /', 200)][:2], [4000, 40000])
+
+    def test3_connections(self):
+        """ counters of connection threads are merged when threads finish """
+        api = FakeAPI({'GET http://localhost/api': {'data': 'ok'}}, history='off')
+        server = api.http_server(port=0, http_prefix='http://localhost', start=False,
+                                 metrics=True)
+        with serving(server):
+            for _ in range(300):
+                conn = http.client.HTTPConnection('localhost', server.server_port, timeout=5)
+                conn.request('GET', '/api', headers={'Connection': 'close'})
+                conn.getresponse().read()
+                conn.close()
+            time.sleep(0.2)
+            self.assertEqual(server.metrics.collect()[('GET http://localhost/api', 200)][0], 300)
+            self.assertLess(len(server.metrics._shards), 10)    # pylint: disable=W0212
+
+
+class TestRecorder(unittest.TestCase):
+    """ recording proxy to a local upstream fakeapi server """
+
+    def test1_record(self):
+        """ calls are forwarded, recorded jsonl loads as url_config """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, 'logo.bin'), 'wb') as binfile:
+                binfile.write(bytes(range(256)))
+            upstream_api = FakeAPI({
+                'GET http://upstream/api/items?id=1': {'data': {'id': 1}},
+                'POST http://upstream/api/items?name=foo': {'status_code': 201,
+                                                            'data': {'id': 2}},
+                'GET http://upstream/api/text': {'data': 'hello', 'content_type': 'text/plain'},
+                'GET http://upstream/api/logo': {'file': os.path.join(tmpdir, 'logo.bin'),
+                                                 'content_type': 'image/png'},
+            })
+            upstream = upstream_api.http_server(port=0, http_prefix='http://upstream',
+                                                start=False)
+            jsonl_file = os.path.join(tmpdir, 'calls.jsonl')
+            recorder = RecordingProxy(f'http://localhost:{upstream.server_port}/api', jsonl_file,
+                                      'http://api.example.com')
+            proxy = FakeAPI().http_server(port=0, start=False, recorder=recorder)
+            url = f'http://localhost:{proxy.server_port}'
+            try:
+                with serving(upstream), serving(proxy):
+                    with requests.Session() as session:
+                        self.assertEqual(session.get(f'{url}/items?id=1', timeout=5).json(),
+                                         {'id': 1})
+                        response = session.post(f'{url}/items', json={'name': 'foo'}, timeout=5)
+                        self.assertEqual((response.status_code, response.json()), (201, {'id': 2}))
+                        self.assertEqual(session.get(f'{url}/text', timeout=5).text, 'hello')
+                        self.assertEqual(session.get(f'{url}/logo', timeout=5).content,
+                                         bytes(range(256)))
+                        self.assertEqual(session.get(f'{url}/none', timeout=5).status_code, 404)
+                    self.assertEqual(recorder._pool.qsize(), 1)    # pylint: disable=W0212
+                    with open(jsonl_file, encoding='utf-8') as jsf:
+                        self.assertEqual(len(jsf.readlines()), 5)    # written as received
+            finally:
+                recorder.close()
+            api = FakeAPI(url_json=jsonl_file)
+            self.assertEqual(api.get('http://api.example.com/items', params={'id': 1}).json(),
+                             {'id': 1})
+            response = api.post('http://api.example.com/items', data={'name': 'foo'})
+            self.assertEqual((response.status_code, response.json()), (201, {'id': 2}))
+            response = api.get('http://api.example.com/text')
+            self.assertEqual((response.text, response.headers['Content-Type']),
+                             ('hello', 'text/plain'))
+            self.assertEqual(api.get('http://api.example.com/logo').content, bytes(range(256)))
+            self.assertEqual(api.get('http://api.example.com/none').status_code, 404)
+            api.url_config.close()
+
+    def test2_record_asyncio(self):
+        """ asyncio proxy forwards concurrent calls without blocking event loop """
+        upstream = FakeAPI({'GET http://upstream/slow': {'data': 'slow', 'delay_ms': 300}}) \
+            .http_server(port=0, http_prefix='http://upstream', start=False)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            recorder = RecordingProxy(f'http://localhost:{upstream.server_port}',
+                                      os.path.join(tmpdir, 'calls.jsonl'))
+            proxy = FakeAPI().http_server(port=0, start=False, engine='asyncio',
+                                          recorder=recorder)
+            url = f'http://localhost:{proxy.server_port}/slow'
+            results = []
+            try:
+                with serving(upstream), serving(proxy):
+                    start = time.perf_counter()
+                    calls = [threading.Thread(target=lambda: results.append(
+                        requests.get(url, timeout=5).text)) for _ in range(6)]
+                    for call_thread in calls:
+                        call_thread.start()
+                    for call_thread in calls:
+                        call_thread.join()
+                    self.assertEqual(results, ['slow'] * 6)
+                    self.assertLess(time.perf_counter() - start, 6 * 0.3)
+                    self.assertEqual(recorder.recorded, 6)
+            finally:
+                recorder.close()
+
+
+class MyAsyncClient():
+    """ asyncio client calling api """
+
+    async def get(self, url, params=None, **kwargs):
+        """ fake call """
+        await asyncio.sleep(0)
+        response = FakeResponse()
+        response.url = url
+        response.text = '{"message": "real api call"}'
+        response.content = response.text.encode('utf-8')
+        return response
+
+    async def call_api(self):
+        """ http get """
+        return (await self.get('http://localhost/api')).json()
+
+    post = get
+    put = get
+    patch = get
+    delete = get
+
+
+class TestAsyncFakeAPI(unittest.IsolatedAsyncioTestCase):
+    """ AsyncFakeAPI for asyncio clients """
+    url_config = {
+        'GET http://localhost/api/items/{id}': {'data': {'id': '{{path.id}}'}, 'template': True},
+        'POST http://localhost/api/items': {'status_code': 201, 'data': {'created': True}},
+        'GET http://localhost/api/slow': {'data': 'slow', 'delay_ms': 200},
+    }
+
+    async def test1_concurrent_calls(self):
+        """ concurrent coroutines, delays waited with asyncio.sleep """
+        api = AsyncFakeAPI(self.url_config, history='counters', sleep=True)
+        responses = await asyncio.gather(*(api.get(f'http://localhost/api/items/{i}')
+                                           for i in range(1000)))
+        self.assertEqual([r.json()['id'] for r in responses], [str(i) for i in range(1000)])
+        response = await api.post('http://localhost/api/items', json={'name': 'foo'})
+        self.assertEqual((response.status_code, response.payload), (201, {'name': 'foo'}))
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(api.get('http://localhost/api/slow')
+                                           for _ in range(500)))
+        elapsed = time.perf_counter() - start
+        self.assertGreaterEqual(elapsed, 0.2)
+        self.assertLess(elapsed, 50, 'delays are not waited concurrently')    # 100 s if serial
+        self.assertEqual(api.url_calls['GET http://localhost/api/slow']['count'], 500)
+
+    async def test2_mock_class(self):
+        """ async client methods patched with AsyncMock """
+        api = AsyncFakeAPI(self.url_config)
+        client = api.mock_class(MyAsyncClient())
+        response = await client.get('http://localhost/api/items/3')
+        self.assertEqual(response.json(), {'id': '3'})
+        client.get.assert_awaited_once_with('http://localhost/api/items/3')
+        self.assertEqual((await client.post('http://localhost/api/items')).status_code, 201)
+        self.assertEqual(await MyAsyncClient().call_api(), {'message': 'real api call'})
+
+
+class TestAdapter(unittest.TestCase):
+    """ FakeAPIAdapter requests transport adapter """
+    api = FakeAPI(url_config, history='counters')
+
+    def setUp(self):
+        """ all requests sessions served by FakeAPI for http://localhost/ """
+        self.adapter = self.api.mock_requests(self, prefixes=('http://localhost/',), record=True)
+
+    def test1_requests(self):
+        """ requests.get/post/request and Session return requests.Response """
+        response = requests.get('http://localhost/api', timeout=5)
+        self.assertIsInstance(response, requests.Response)
+        self.assertEqual(response.json(), {'message': 'Call successfull'})
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        response = requests.post('http://localhost/api', data={'name': 'foo bar'}, timeout=5)
+        self.assertEqual((response.status_code, response.json()),
+                         (201, {'message': 'foo bar created'}))
+        response = requests.request('PATCH', 'http://localhost/api/1', json={'name': 'foo/bar'},
+                                    timeout=5)
+        self.assertEqual((response.status_code, response.json()),
+                         (404, {'message': 'failed to update: no item with id 1'}))
+        with requests.Session() as session:
+            response = session.get('http://localhost/api', params={'test': 'yop man'}, timeout=5)
+            self.assertTrue(response.ok)
+            etag = response.headers['ETag']
+            response = session.get('http://localhost/api', headers={'If-None-Match': etag})
+            self.assertEqual((response.status_code, response.content), (304, b''))
+            response = session.get('http://localhost/none', timeout=5)
+            self.assertEqual((response.status_code, response.reason), (404, 'Not Found'))
+        self.assertEqual([call.method for call in self.adapter.calls],
+                         ['GET', 'POST', 'PATCH', 'GET', 'GET', 'GET'])
+        with self.assertRaises(requests.ConnectionError):
+            requests.get('http://127.0.0.1:1/api', timeout=5)
+
+
+class TestResources(unittest.TestCase):
+    """ stateful RESOURCE collections """
+    url_config = {
+        'RESOURCE http://localhost/comments': {
+            'indexes': ['name'], 'page_size': 2,
+            'data': [{'id': 1, 'name': 'sample', 'tag': 'a'}],
+        },
+        'GET http://localhost/comments/static': {'data': 'static route'},
+    }
+
+    def test1_crud(self):
+        """ POST/GET/PUT/PATCH/DELETE on collection and items """
+        api = FakeAPI(self.url_config)
+        response = api.post('http://localhost/comments', data={'name': 'sample', 'tag': 'b'})
+        self.assertEqual((response.status_code, response.json()),
+                         (201, {'name': 'sample', 'tag': 'b', 'id': 2}))
+        api.post('http://localhost/comments', data={'name': 'other', 'tag': 'b'})
+        self.assertEqual(api.post('http://localhost/comments', data={'id': 1}).status_code, 409)
+        self.assertEqual(api.get('http://localhost/comments/2').json()['tag'], 'b')
+        self.assertEqual(api.get('http://localhost/comments/static').text, 'static route')
+        response = api.get('http://localhost/comments')
+        self.assertEqual([item['id'] for item in response.json()], [1, 2])
+        self.assertEqual(response.headers['X-Total-Count'], '3')
+        response = api.get('http://localhost/comments', params={'offset': 2, 'limit': 5})
+        self.assertEqual([item['id'] for item in response.json()], [3])
+        response = api.get('http://localhost/comments', params={'name': 'sample', 'tag': 'b'})
+        self.assertEqual([item['id'] for item in response.json()], [2])
+        response = api.patch('http://localhost/comments/2', data={'name': 'patched'})
+        self.assertEqual(response.json(), {'name': 'patched', 'tag': 'b', 'id': 2})
+        response = api.get('http://localhost/comments', params={'name': 'sample'})
+        self.assertEqual([item['id'] for item in response.json()], [1])
+        response = api.put('http://localhost/comments/1', data={'name': 'put'})
+        self.assertEqual(response.json(), {'name': 'put', 'id': 1})
+        self.assertEqual(api.delete('http://localhost/comments/1').status_code, 200)
+        self.assertEqual(api.get('http://localhost/comments/1').status_code, 404)
+        self.assertEqual(api.get('http://localhost/comments', params={'name': 'put'}).json(), [])
+        self.assertEqual(api.delete('http://localhost/comments').status_code, 405)
+        api.update_config(dict(self.url_config, **{'GET http://localhost/new': {'data': 1}}))
+        self.assertEqual(api.get('http://localhost/comments/2').json()['name'], 'patched')
+
+    def test2_concurrent(self):
+        """ concurrent creations from server threads """
+        api = FakeAPI(self.url_config, history='off')
+        threads = [threading.Thread(target=lambda: [
+            api.post('http://localhost/comments', data={'name': 'thread'}) for _ in range(200)])
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        response = api.get('http://localhost/comments', params={'name': 'thread', 'limit': 2000})
+        self.assertEqual(len({item['id'] for item in response.json()}), 1600)
+
+    def test3_json_filters(self):
+        """ filters match json form of booleans, null and numbers, indexed or not """
+        for indexes in ([], ['done', 'parent']):
+            api = FakeAPI({'RESOURCE http://localhost/tasks': {'indexes': indexes, 'data': [
+                {'id': 1, 'done': True, 'parent': None, 'rank': 1.5},
+                {'id': 2, 'done': False, 'parent': 1, 'rank': 2},
+            ]}})
+            for params, ids in (({'done': 'true'}, [1]), ({'done': 'false'}, [2]),
+                                ({'parent': 'null'}, [1]), ({'parent': 1}, [2]),
+                                ({'rank': '1.5'}, [1]), ({'done': 'True'}, [])):
+                response = api.get('http://localhost/tasks', params=params)
+                self.assertEqual([item['id'] for item in response.json()], ids, (indexes, params))
+
+    def test4_server_metrics(self):
+        """ resource calls are counted under RESOURCE key, not as misses """
+        api = FakeAPI(self.url_config, history='off')
+        server = api.http_server(port=0, http_prefix='http://localhost', start=False,
+                                 metrics=True)
+        url = f'http://localhost:{server.server_port}'
+        with serving(server):
+            with requests.Session() as session, self.assertLogs('fakeapi', level='INFO') as logs:
+                self.assertEqual(session.get(f'{url}/comments/1', timeout=5).json()['id'], 1)
+                session.post(f'{url}/comments', json={'name': 'new'}, timeout=5)
+            metrics = server.metrics.to_json()
+        self.assertFalse([line for line in logs.output if 'No URL config' in line])
+        self.assertEqual(metrics['misses'], 0)
+        self.assertEqual(metrics['routes']['RESOURCE http://localhost/comments']['status'],
+                         {'200': 1, '201': 1})
+
+    def test5_copies(self):
+        """ returned items are copies, updated items keep their position """
+        api = FakeAPI(self.url_config)
+        data = {'name': 'second', 'tags': ['x']}
+        api.post('http://localhost/comments', data=data)
+        data['tags'].append('y')
+        item = api.get('http://localhost/comments/1').json()
+        item['name'] = 'zzz'
+        api.get('http://localhost/comments', params={'limit': 5}).json()[1]['tags'].append('z')
+        response = api.get('http://localhost/comments', params={'name': 'sample'})
+        self.assertEqual([item['name'] for item in response.json()], ['sample'])
+        self.assertEqual(api.get('http://localhost/comments/2').json()['tags'], ['x'])
+        api.patch('http://localhost/comments/1', data={'name': 'patched'})
+        api.put('http://localhost/comments/1', data={'name': 'put'})
+        response = api.get('http://localhost/comments', params={'limit': 5})
+        self.assertEqual([item['name'] for item in response.json()], ['put', 'second'])
+        self.assertEqual(self.url_config['RESOURCE http://localhost/comments']['data'][0]['name'],
+                         'sample')
+
+
+class TestStream(unittest.TestCase):
+    """ stream routes: chunked json of sliced lists """
+    items = [{'id': i, 'name': f'item{i}'} for i in range(20000)]
+    api = FakeAPI({'GET http://localhost/items': {'data': items, 'stream': True}})
+
+    def test1_in_process(self):
+        """ json chunks, offset/limit/cursor slicing """
+        self.assertEqual(b''.join(json_chunks(self.items, 1024)), json.dumps(self.items).encode())
+        self.assertEqual(list(json_chunks([])), [b'[]'])
+        response = self.api.get('http://localhost/items')
+        self.assertEqual(response.json(), self.items)
+        self.assertEqual(response.text, json.dumps(self.items))
+        response = self.api.get('http://localhost/items', params={'offset': 10, 'limit': 5})
+        self.assertEqual([item['id'] for item in response.json()], list(range(10, 15)))
+        self.assertEqual(response.headers['X-Total-Count'], '20000')
+        response = self.api.get('http://localhost/items',
+                                params={'cursor': response.headers['X-Next-Cursor'], 'limit': 2})
+        self.assertEqual(response.json(), self.items[15:17])
+        self.assertEqual(self.api.get('http://localhost/items',
+                                      params={'cursor': 'bad'}).status_code, 400)
+        self.assertEqual(self.api.get('http://localhost/items', params={'q': 1}).status_code, 404)
+
+    def test2_server(self):
+        """ Transfer-Encoding: chunked response """
+        for engine in ('threading', 'asyncio'):
+            server = self.api.http_server(port=0, http_prefix='http://localhost', start=False,
+                                          engine=engine)
+            url = f'http://localhost:{server.server_port}/items'
+            with serving(server):
+                with requests.Session() as session:
+                    response = session.get(url, timeout=5)
+                    self.assertEqual(response.headers['Transfer-Encoding'], 'chunked')
+                    self.assertNotIn('Content-Length', response.headers)
+                    self.assertEqual(response.json(), self.items)
+                    response = session.get(url, params={'limit': 3}, timeout=5)
+                    self.assertEqual(response.json(), self.items[:3])
+                    self.assertIn('X-Next-Cursor', response.headers)
+
+
+class TestBodyMatchers(unittest.TestCase):
+    """ routes matched by request body: canonical json, json subset, regex """
+    url_config = {
+        'POST http://localhost/api/users': {'data': 'default'},
+        'POST http://localhost/api/users#exact': {'body': {'json': {'name': 'admin', 'roles': [1]}},
+                                                  'data': 'exact'},
+        'POST http://localhost/api/users#subset': {'body': {'subset': {'user': {'role': 'guest'}}},
+                                                   'data': 'subset'},
+        'POST http://localhost/api/users#regex': {'body': {'regex': '"name":"bot-\\d+"'},
+                                                  'data': 'regex'},
+    }
+
+    def test1_in_process(self):
+        """ matcher priority, key order independent json, fallback to route without body """
+        api = FakeAPI(dict(self.url_config))
+        calls = [
+            ({'roles': [1], 'name': 'admin'}, 'exact'),
+            ('{"name": "admin",\n "roles": [1]}', 'exact'),
+            ({'user': {'role': 'guest', 'id': 3}, 'other': [1, {}]}, 'subset'),
+            ({'user': {'role': 'admin'}}, 'default'),
+            ({'name': 'bot-12'}, 'regex'),
+            ({'name': 'admin', 'roles': [1, 2]}, 'default'),
+            (None, 'default'),
+        ]
+        for data, expected in calls:
+            self.assertEqual(api.post('http://localhost/api/users', data=data).text, expected)
+        self.assertEqual(api.url_history[-3], 'POST http://localhost/api/users')
+        self.assertEqual(len(api.body_index), 1)
+        del api.url_config['POST http://localhost/api/users']
+        api.reindex()
+        self.assertEqual(api.post('http://localhost/api/users', data={'a': 1}).status_code, 404)
+        with self.assertRaises(ValueError):
+            FakeAPI({'POST http://localhost/api': {'body': {'jsonpath': 'x'}}})
+
+    def test2_update_server(self):
+        """ matchers updated by update_config, json body of http requests """
+        api = FakeAPI({'POST http://localhost/api/users': {'data': 'default'}})
+        diff = api.update_config(self.url_config)
+        self.assertEqual(len(diff['added']), 3)
+        server = api.http_server(port=0, http_prefix='http://localhost', start=False)
+        url = f'http://localhost:{server.server_port}/api/users'
+        with serving(server):
+            with requests.Session() as session:
+                self.assertEqual(session.post(url, json={'roles': [1], 'name': 'admin'},
+                                              timeout=5).text, 'exact')
+                self.assertEqual(session.post(url, json={'x': 1}, timeout=5).text, 'default')
+                url_config = dict(self.url_config)
+                url_config['POST http://localhost/api/users'] = {
+                    'body': {'json': {'x': 1}}, 'data': 'x'}
+                api.update_config(url_config)
+                self.assertEqual(session.post(url, json={'x': 1}, timeout=5).text, 'x')
+                self.assertEqual(session.post(url, json={'x': 2}, timeout=5).status_code, 404)
+
+
+class TestMemory(unittest.TestCase):
+    """ shared bodies, compact url_config, memory report """
+
+    def test1_compact(self):
+        """ identical data shared between routes """
+        url_config = {f'GET http://localhost/api/{i}': {'data': {'message': 'same', 'items': [1, 2]}}
+                      for i in range(100)}
+        url_config['GET http://localhost/other'] = {'data': {'message': 'other'}}
+        api = FakeAPI(url_config, history='counters')
+        report = api.memory_report()
+        self.assertEqual(api.compact(), 99)
+        self.assertIs(url_config['GET http://localhost/api/0']['data'],
+                      url_config['GET http://localhost/api/99']['data'])
+        responses = [api.get(f'http://localhost/api/{i}') for i in range(100)]
+        self.assertEqual(responses[0].json(), {'message': 'same', 'items': [1, 2]})
+        self.assertIs(responses[0].content, responses[99].content)
+        self.assertEqual(len(api.bodies), 1)
+        compact_report = api.memory_report()
+        self.assertLess(compact_report['url_config_bytes'], report['url_config_bytes'])
+        self.assertEqual((compact_report['routes'], compact_report['cached_routes']), (101, 100))
+        self.assertEqual(compact_report['total_bytes'],
+                         sum(value for name, value in compact_report.items()
+                             if name.endswith('_bytes') and name != 'total_bytes'))
+        self.assertFalse(hasattr(responses[0], '__dict__'))
+
+
+class TestStartup(unittest.TestCase):
+    """ compiled url_config cache, lazy imports """
+
+    def test1_compiled_cache(self):
+        """ cache written on miss, used on hit, invalidated when json file changes """
+        url_config = {
+            'GET http://localhost/api?id=1': {'data': {'id': 1}},
+            'GET http://localhost/api/items/{id}': {'data': {'id': '{{path.id}}'},
+                                                    'template': True},
+            'RESOURCE http://localhost/comments': {'data': [{'id': 1}]},
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            url_json = os.path.join(tmpdir, 'api.json')
+            with open(url_json, 'w', encoding='utf-8') as jsf:
+                json.dump(url_config, jsf)
+            api = FakeAPI(url_json=url_json, compiled_cache=True)
+            self.assertEqual(api.timings['cache'], 'miss')
+            self.assertTrue(os.path.exists(url_json + '.fakeapi-cache'))
+            for _ in range(2):
+                api = FakeAPI(url_json=url_json, compiled_cache=True)
+                self.assertEqual(api.timings['cache'], 'hit')
+                self.assertEqual(api.url_config, url_config)
+                self.assertEqual(api.get('http://localhost/api', params={'id': 1}).json(),
+                                 {'id': 1})
+                self.assertEqual(api.get('http://localhost/api/items/3').json(), {'id': '3'})
+                self.assertEqual(api.get('http://localhost/comments/1').json(), {'id': 1})
+                os.utime(url_json, ns=(0, 0))    # same content: hash still matches
+            url_config['GET http://localhost/api?id=1'] = {'data': {'id': 2}}
+            with open(url_json, 'w', encoding='utf-8') as jsf:
+                json.dump(url_config, jsf)
+            api = FakeAPI(url_json=url_json, compiled_cache=True)
+            self.assertEqual(api.timings['cache'], 'miss')
+            self.assertEqual(api.get('http://localhost/api', params={'id': 1}).json(), {'id': 2})
+            with open(url_json + '.fakeapi-cache', 'wb') as cache:
+                cache.write(b'garbage')
+            api = FakeAPI(url_json=url_json, compiled_cache=True)
+            self.assertEqual(api.timings['cache'], 'miss')
+            self.assertEqual(FakeAPI(url_json=url_json).timings['cache'], 'off')
+
+    def test2_lazy_imports(self):
+        """ requests, asyncio and unittest.mock are not imported by server, even once serving """
+        code = ('import sys, fakeapi.__main__; '
+                'print(" ".join(m for m in ("requests", "asyncio", "unittest.mock") '
+                'if m in sys.modules))')
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                check=True)
+        self.assertEqual(result.stdout.strip(), '')
+        code = (
+            'import sys, threading, http.client\n'
+            'from fakeapi import FakeAPI\n'
+            'server = FakeAPI({"GET http://localhost/api?q=a b": {"data": "ok"}}).http_server(\n'
+            '    port=0, http_prefix="http://localhost", start=False)\n'
+            'threading.Thread(target=server.serve_forever, daemon=True).start()\n'
+            'conn = http.client.HTTPConnection("localhost", server.server_port, timeout=5)\n'
+            'conn.request("GET", "/api?q=a%20b")\n'
+            'print(conn.getresponse().read().decode(), "requests" in sys.modules)\n'
+        )
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                check=True)
+        self.assertEqual(result.stdout.strip(), 'ok False')
+
+
+class TestReload(unittest.TestCase):
+    """ incremental url_config update, json file watcher, admin routes endpoint """
+    url_config = {
+        'GET http://localhost/api': {'data': {'message': 'ok'}},
+        'GET http://localhost/api/items/{id}': {'data': {'id': '{{path.id}}'}, 'template': True},
+        'GET http://localhost/api/old': {'data': 'old'},
+    }
+
+    def test1_update_config(self):
+        """ only changed routes are reindexed, unchanged keep cached route """
+        api = FakeAPI(dict(self.url_config))
+        route = api.lookup([('GET', 'http://localhost/api', ())])[0]
+        url_config = dict(self.url_config, **{
+            'GET http://localhost/api/items/{id}': {'data': {'item': '{{path.id}}'},
+                                                   'template': True},
+            'GET http://localhost/api/new?q=1': {'data': 'new'},
+        })
+        del url_config['GET http://localhost/api/old']
+        diff = api.update_config(url_config)
+        self.assertEqual(diff, {'added': ['GET http://localhost/api/new?q=1'],
+                                'removed': ['GET http://localhost/api/old'],
+                                'changed': ['GET http://localhost/api/items/{id}']})
+        self.assertIs(api.lookup([('GET', 'http://localhost/api', ())])[0], route)
+        self.assertEqual(api.get('http://localhost/api/items/3').json(), {'item': '3'})
+        self.assertEqual(api.get('http://localhost/api/new', params={'q': 1}).text, 'new')
+        self.assertEqual(api.get('http://localhost/api/old').status_code, 404)
+
+    def test2_watcher(self):
+        """ json file changes are reloaded, invalid json keeps previous routes """
+        for use_inotify in (True, False):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                url_json = os.path.join(tmpdir, 'urls.json')
+                with open(url_json, 'w', encoding='utf-8') as jsf:
+                    json.dump(self.url_config, jsf)
+                api = FakeAPI(url_json=url_json)
+                watcher = ConfigWatcher(api, url_json, interval=0.05,
+                                        use_inotify=use_inotify).start()
+                try:
+                    with open(url_json, 'w', encoding='utf-8') as jsf:
+                        jsf.write('{"GET http://localhost/api": ')
+                    time.sleep(0.3)
+                    self.assertEqual(api.get('http://localhost/api').json(), {'message': 'ok'})
+                    with open(url_json + '.tmp', 'w', encoding='utf-8') as jsf:
+                        json.dump({'GET http://localhost/api': {'data': 'reloaded'}}, jsf)
+                    os.replace(url_json + '.tmp', url_json)
+                    for _ in range(100):
+                        if api.get('http://localhost/api').text == 'reloaded':
+                            break
+                        time.sleep(0.05)
+                    self.assertEqual(api.get('http://localhost/api').text, 'reloaded')
+                    self.assertEqual(api.get('http://localhost/api/old').status_code, 404)
+                finally:
+                    watcher.stop()
+
+    def test3_watcher_invalid_routes(self):
+        """ invalid routes are reported, watcher keeps reloading, json lines files reload """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            url_json = os.path.join(tmpdir, 'urls.json')
+            with open(url_json, 'w', encoding='utf-8') as jsf:
+                json.dump(self.url_config, jsf)
+            api = FakeAPI(url_json=url_json)
+            watcher = ConfigWatcher(api, url_json, interval=0.05, use_inotify=False).start()
+            try:
+                with open(url_json, 'w', encoding='utf-8') as jsf:
+                    json.dump({'POST http://localhost/api': {'body': {'bad': 1}}}, jsf)
+                time.sleep(0.3)
+                self.assertEqual(api.get('http://localhost/api').json(), {'message': 'ok'})
+                with open(url_json, 'w', encoding='utf-8') as jsf:
+                    json.dump({'GET http://localhost/api': {'data': 'reloaded'}}, jsf)
+                for _ in range(100):
+                    if api.get('http://localhost/api').text == 'reloaded':
+                        break
+                    time.sleep(0.05)
+                self.assertEqual(api.get('http://localhost/api').text, 'reloaded')
+            finally:
+                watcher.stop()
+            url_jsonl = os.path.join(tmpdir, 'urls.jsonl')
+            write_jsonl({'GET http://localhost/a': {'data': 'a'}}, url_jsonl)
+            api = FakeAPI(url_json=url_jsonl)
+            write_jsonl({'GET http://localhost/a': {'data': 'a'},
+                         'GET http://localhost/b': {'data': 'b'}}, url_jsonl)
+            diff = ConfigWatcher(api, url_jsonl).reload()
+            self.assertEqual(diff['added'], ['GET http://localhost/b'])
+            self.assertEqual(api.get('http://localhost/b').text, 'b')
+
+    def test4_admin(self):
+        """ PATCH /_fakeapi/routes """
+        api = FakeAPI(dict(self.url_config))
+        server = api.http_server(port=0, http_prefix='http://localhost', start=False, admin=True)
+        url = f'http://localhost:{server.server_port}'
+        with serving(server):
+            response = requests.patch(f'{url}/_fakeapi/routes', timeout=5, json={
+                'GET http://localhost/api': {'data': 'patched'},
+                'GET http://localhost/api/old': None,
+            })
+            self.assertEqual(response.json()['changed'], ['GET http://localhost/api'])
+            self.assertEqual(response.json()['removed'], ['GET http://localhost/api/old'])
+            self.assertEqual(requests.get(f'{url}/api', timeout=5).text, 'patched')
+            self.assertEqual(requests.get(f'{url}/_fakeapi/routes', timeout=5).json(),
+                             list(self.url_config)[:2])
+            self.assertEqual(requests.patch(f'{url}/_fakeapi/routes', data='[',
+                                            timeout=5).status_code, 400)
+            for url_conf in ('patched', 1, {'body': {'jsonpath': 'x'}}):
+                response = requests.patch(f'{url}/_fakeapi/routes', timeout=5,
+                                          json={'POST http://localhost/api': url_conf})
+                self.assertEqual(response.status_code, 400)
+            self.assertEqual(requests.get(f'{url}/api', timeout=5).text, 'patched')
+
+
 ### Handler mock ###
 class MockRequest():
     """ mock request """
@@ -276,6 +1517,7 @@ class MockRequest():
         """ makefile GET / """
         return IO(b"GET /")
 
+
 class MockServer(FakeAPIServer):
     """ Mock HTTPServer """
     def __init__(self, fakeapi, http_prefix, ip_port, Handler):
@@ -285,6 +1527,7 @@ class MockServer(FakeAPIServer):
         self.content_type = 'text/plain'
         self.handler = Handler(MockRequest(), ip_port, self)
 
+
 class TestHandler(unittest.TestCase):
     """ test FAKEAPIHTTPHandler """
     def test999_handler(self):